@@ -16,9 +16,11 @@ Features:
 
 Usage:
     python ascii_mandala.py [width] [height] [fps] [frames] [palette] [change_count] [change_amount]
+    python ascii_mandala.py render OUTPUT [--frames N] [--animate PARAM[:DIR] ...] [--rate R] [--seed S] [--jobs J]
 
 Example:
     python ascii_mandala.py 120 40 60 5000 6 2 0.2
+    python ascii_mandala.py render out.gif --frames 600 --animate phase_a freq_r:-1 --seed 7
 
 Controls:
     w/s = freq_r ±       a/d = freq_a ±
@@ -28,28 +30,27 @@ Controls:
     f   = save PNG       x = export GIF
     +/– = speed control  h = show help
     q   = quit           v = export PNG sequence
+    t   = stage timings (p50/p99)
 
 Designed for expressive terminal art and joyful experimentation.
 """
 
-import math, random, sys, os, time, argparse, platform
+import math, random, sys, os, time, argparse, platform, threading
+import importlib.util
 import subprocess
-import sys
-import platform
 
 # List of required libraries for all platforms
 required_libraries = [
     ("PIL", "Pillow"),
     ("fontTools", "fonttools"),
+    ("numpy", "numpy"),
 ]
 
 # --- Install missing libraries ---
 def install_missing_libraries():
-    # Install common libraries
+    # Install common libraries, find_spec only looks the package up without importing it
     for import_name, package_name in required_libraries:
-        try:
-            __import__(import_name)
-        except ImportError:
+        if importlib.util.find_spec(import_name) is None:
             print(f"⚠️ Missing library: {package_name}. Installing now...")
             subprocess.check_call([sys.executable, "-m", "pip", "install", package_name])
 
@@ -57,12 +58,19 @@ def install_missing_libraries():
     #if platform.system() == "Windows":
     #elif platform.system() == "Linux":
 
-# Install missing libraries before running the main program
-install_missing_libraries()
+# Install missing libraries before running the main program (only when run as a script, importing has no side effects)
+if __name__ == "__main__":
+    install_missing_libraries()
+
+# Now import the libraries (they should be installed now). PIL and fontTools are imported lazily when capturing
+# or scanning fonts, so the engine can be imported from tests, benchmarks and other tools.
 
-# Now import the libraries (they should be installed now)
-from PIL import ImageFont
-from fontTools.ttLib import TTFont
+from mandala_ansi import COLOR_MODES, AnsiEmitter
+from mandala_engine import HUE_RGB, MandalaEngine, palette_array
+from mandala_fonts import FontCoverageIndex, list_fonts
+from mandala_pipeline import FramePipeline
+from mandala_replay import LoggedParams
+from mandala_timing import FrameScheduler, FrameTimer, LodController, open_trace
 
 # OS detection
 IS_WINDOWS = platform.system() == "Windows"
@@ -71,7 +79,7 @@ if IS_WINDOWS:
 else:
     import termios, tty, select
 
-# Parse command-line arguments
+# Command-line arguments, parsed in main()
 parser = argparse.ArgumentParser()
 parser.add_argument("width", type=int, nargs="?", default=120, help="Width in characters")
 parser.add_argument("height", type=int, nargs="?", default=24, help="Height in characters")
@@ -80,22 +88,65 @@ parser.add_argument("frames", type=int, nargs="?", default=10000, help="Total fr
 parser.add_argument("palette", type=int, nargs="?", default=0, help="Palette index (1–8)")
 parser.add_argument("change_count", type=int, nargs="?", default=1, help="Number of parameters to change simultaneously")
 parser.add_argument("change_amount", type=float, nargs="?", default=0.05, help="Amount to change parameters by")
-args = parser.parse_args()
-
-WIDTH, HEIGHT = args.width, args.height
-FPS, FRAMES = args.fps, args.frames
-CHANGE_COUNT = args.change_count
-CHANGE_AMOUNT = [args.change_amount]  # wrap in list
-DELAY = 1.0 / FPS
+capture_mode = parser.add_mutually_exclusive_group()
+capture_mode.add_argument("--stream", choices=["gif", "mp4", "log"],
+                          help="Write captured frames straight to a GIF/MP4 file (needs ffmpeg for mp4) "
+                               "or record a compact parameter log for mandala_replay.py")
+capture_mode.add_argument("--ring", type=float, metavar="SECONDS",
+                          help="Keep only the last SECONDS of frames in a memory-mapped ring file, x/v export from it")
+parser.add_argument("--ring-file", default="mandala_ring.npy", help="Backing file for --ring")
+parser.add_argument("--frame-policy", choices=["drop", "slow"], default="drop",
+                    help="On overrun: drop = skip drawing late frames to stay in sync with wall-clock time, "
+                         "slow = slow down")
+parser.add_argument("--pipeline", type=int, nargs="?", const=1, default=0, choices=[1, 2], metavar="DEPTH",
+                    help="Generate the next frame(s) in a worker thread while the current one is written (depth 1–2)")
+parser.add_argument("--colors", choices=COLOR_MODES, default="truecolor",
+                    help="Terminal color mode, 256 and 16 send far fewer bytes over slow links and tmux")
+parser.add_argument("--lod", action="store_true",
+                    help="Adaptive level of detail: compute fewer cells and update colors less often "
+                         "when frames overrun")
+parser.add_argument("--stats", action="store_true", help="Show p50/p99 stage timings below the frame (t toggles)")
+parser.add_argument("--trace", metavar="FILE",
+                    help="Write per-frame stage timings to FILE (.json = Chrome trace, otherwise CSV)")
+
+DEFAULT_FONT = "fonts/Symbola.ttf"
 recording = [False]  # wrapped in list for mutability
 frames = [] # For storing animation frames for export
+stream_writer = [None]  # Open GIF/MP4/parameter log writer while recording with --stream
+capture_error = [None]  # Why the last capture could not start (e.g. no ffmpeg), shown in the status line
+frame_ring = [None]  # FrameRing replacing the frames list with --ring
+best_font_path = [DEFAULT_FONT]  # Replaced by the background font selection
+font_selection = [None]  # Background font selection thread
+
+def configure(options):
+    # Sets the module settings from parsed arguments, the defaults apply when imported as a module
+    global args, WIDTH, HEIGHT, FPS, FRAMES, CHANGE_COUNT, CHANGE_AMOUNT, DELAY, engine
+    args = options
+    WIDTH, HEIGHT = args.width, args.height
+    FPS, FRAMES = args.fps, args.frames
+    CHANGE_COUNT = args.change_count
+    CHANGE_AMOUNT = [args.change_amount]  # wrap in list
+    DELAY = 1.0 / FPS
+    engine = MandalaEngine(WIDTH, HEIGHT)
+
+configure(parser.parse_args([]))
 
 # Terminal setup
-if not IS_WINDOWS:
-    original_settings = termios.tcgetattr(sys.stdin)
-    tty.setcbreak(sys.stdin.fileno())
-sys.stdout.write("\033[?25l\033[2J")  # Hide cursor, clear screen
-sys.stdout.flush()
+original_settings = None
+
+def setup_terminal():
+    global original_settings
+    if not IS_WINDOWS:
+        original_settings = termios.tcgetattr(sys.stdin)
+        tty.setcbreak(sys.stdin.fileno())
+    sys.stdout.write("\033[?25l\033[2J\033[H")  # Hide cursor, clear screen
+    sys.stdout.flush()
+
+def restore_terminal():
+    if not IS_WINDOWS and original_settings is not None:
+        termios.tcsetattr(sys.stdin, termios.TCSADRAIN, original_settings)
+    sys.stdout.write("\033[?25h\033[0m\n")  # Show cursor, reset
+    sys.stdout.flush()
 
 def get_key():
     if IS_WINDOWS:
@@ -109,58 +160,81 @@ def show_controls_inline():
     sys.stdout.write(
         "🎮 w/s=freq_r a/d=freq_a i/k=phase_a j/l=phase_r p=next_palette 1–8=select_palette r=randomize space=freeze"
     )
-    sys.stdout.write("\n+/–=speed h=help q=quit f=export PNG c=toggle capture x=export GIF v=export PNG sequence")
+    sys.stdout.write(
+        "\n+/–=speed h=help q=quit f=export PNG c=toggle capture x=export GIF v=export PNG sequence t=timings"
+    )
     sys.stdout.flush()
 
-def font_has_glyph(font_path, ch):
-    try:
-        font = TTFont(font_path)
-        for table in font['cmap'].tables:
-            if ord(ch) in table.cmap:
-                return True  # Found the glyph
-    except Exception:
-        pass
-    return False
+font_index = None  # Persistent cmap cache shared with font_chooser.py, loaded on first use
 
-def find_best_font(palettes, font_dir="fonts"):
+def get_font_index():
+    global font_index
+    if font_index is None:
+        font_index = FontCoverageIndex()
+    return font_index
+
+def find_best_font(palettes, font_dir="fonts", verbose=True):
     # Etsii fonts-kansiosta fontin, joka tukee eniten annettuja merkkejä kaikista paleteista
-    font_candidates = [
-        os.path.join(font_dir, f)
-        for f in os.listdir(font_dir)
-        if f.lower().endswith((".ttf", ".otf"))  # Hae kaikki .ttf ja .otf fontit
-    ]
+    font_candidates = list_fonts(font_dir)  # Hae kaikki .ttf ja .otf fontit
 
     best_font = None
     max_supported = -1
+    total_chars = sum(len(line) for line in palettes)
 
-    print("Tarkistetaan fonttien symbolitukea...")
+    log = print if verbose else (lambda *a, **k: None)  # Hiljaa taustasäikeessä, ruutu on jo animaation käytössä
+    log("Tarkistetaan fonttien symbolitukea...")
 
     for font_path in font_candidates:
         try:
-            font = TTFont(font_path)
+            # Fontin cmap luetaan vain kerran, tulos tallennetaan välimuistiin
+            supported, total_chars = get_font_index().coverage(font_path, palettes)
         except Exception as e:
-            print(f"⚠️ Virhe ladattaessa fonttia {font_path}: {e}")
+            log(f"⚠️ Virhe ladattaessa fonttia {font_path}: {e}")
             continue
 
-        supported = 0
-        for palette_line in palettes:
-            for ch in palette_line:
-                if ch == ' ' or font_has_glyph(font_path, ch):
-                    supported += 1
-        # Laske palettes kaikki merkit
-        total_chars = sum(len(line) for line in palettes)
-        print(f"🔍 {os.path.basename(font_path)} tukee {supported}/{total_chars} merkkiä")
+        log(f"🔍 {os.path.basename(font_path)} tukee {supported}/{total_chars} merkkiä")
         if supported > max_supported:
             max_supported = supported
             best_font = font_path
+    get_font_index().save()
 
     if best_font:
-        print(f"\n✅ Paras fontti: {os.path.basename(best_font)} ({max_supported}/{total_chars} merkkiä tuettu)")
+        log(f"\n✅ Paras fontti: {os.path.basename(best_font)} ({max_supported}/{total_chars} merkkiä tuettu)")
     else:
-        print("❌ Yksikään fontti ei tue annettuja merkkejä")
+        log("❌ Yksikään fontti ei tue annettuja merkkejä")
 
     return best_font
 
+def start_font_selection(params):
+    # Font scanning runs in the background (usually a cache hit), so the first frame does not wait for it
+    def select():
+        best_font_path[0] = find_best_font(params.palettes, verbose=False) or DEFAULT_FONT
+        params.font_name = os.path.splitext(os.path.basename(best_font_path[0]))[0]
+    font_selection[0] = threading.Thread(target=select, daemon=True)
+    font_selection[0].start()
+
+def selected_font():
+    # Captures need the final font, wait for the selection if it is still running
+    if font_selection[0] is not None:
+        font_selection[0].join()
+    return best_font_path[0]
+
+PALETTES = tuple(palette_array(chars) for chars in [  # 8 different character palettes
+    [' ', '.', '*', '+', 'x', 'X', 'o', 'O', '@', '#'],
+    [' ', '-', '=', '~', '^', '*', '%', '$', '&', '#'],
+    [' ', '.', ':', ';', '!', '?', '/', '|', '\\', '#'],
+    [' ', '·', '•', '*', '¤', '°', '○', '●', '◎', '■'],
+    [' ', '˙', '⁕', '✦', '✧', '✶', '✷', '✸', '✺', '✹'],
+    [' ', '·', '•', '◦', '○', '◉', '◎', '◍', '◯', '⬤'],
+    [' ', '░', '▒', '▓', '▙', '▛', '▜', '▟', '█', '■'],
+    [' ', '⎯', '⎼', '⎻', '﹏', '╌', '╍', '╏', '╎', '╳']
+])
+TRANSITION_FRAMES = 30  # Palette transition length, the target palette takes over for the last 9 frames
+
+def transition_schedule(source, target, frames=TRANSITION_FRAMES):
+    # Palette index of every frame of a transition, computed once when it starts
+    return tuple(target if remaining < 10 else source for remaining in range(frames, 0, -1))
+
 class MandalaParams:
     def __init__(self, palette_index=0):
         self.freq_r = random.uniform(0.1, 1.5)
@@ -169,25 +243,32 @@ class MandalaParams:
         self.phase_a = random.uniform(0, math.pi * 2)
         self.offset_x = random.randint(-5, 5)
         self.offset_y = random.randint(-5, 5)
-        self.palettes = [  # 8 different character palettes
-            [' ', '.', '*', '+', 'x', 'X', 'o', 'O', '@', '#'],
-            [' ', '-', '=', '~', '^', '*', '%', '$', '&', '#'],
-            [' ', '.', ':', ';', '!', '?', '/', '|', '\\', '#'],
-            [' ', '·', '•', '*', '¤', '°', '○', '●', '◎', '■'],
-            [' ', '˙', '⁕', '✦', '✧', '✶', '✷', '✸', '✺', '✹'],
-            [' ', '·', '•', '◦', '○', '◉', '◎', '◍', '◯', '⬤'],
-            [' ', '░', '▒', '▓', '▙', '▛', '▜', '▟', '█', '■'],
-            [' ', '⎯', '⎼', '⎻', '﹏', '╌', '╍', '╏', '╎', '╳']
-        ]
+        self.palettes = PALETTES  # Immutable arrays, frames index them directly
         self.palette_index = max(0, min(palette_index, len(self.palettes) - 1))
-        self.transition_frames = 0
         self.target_palette_index = self.palette_index
-        self.font_name = "fonts/Symbola.ttf"
+        self.transition = ()  # Palette index of each remaining transition frame
+        self.frame_palette_index = self.palette_index  # Palette of the latest frame snapshot
+        self.font_name = DEFAULT_FONT
         self.font_size = 14
 
     @property
     def palette(self):
-        return self.get_blended_palette()
+        # Palette of the latest frame, reading it does not advance transitions (next_palette_index() does)
+        return self.palettes[self.frame_palette_index]
+
+    def start_transition(self, target):
+        self.target_palette_index = target
+        self.transition = transition_schedule(self.palette_index, target)
+
+    def next_palette_index(self):
+        """Takes the palette snapshot of the next frame, exactly once per frame, and advances any transition."""
+        if self.transition:
+            self.frame_palette_index, self.transition = self.transition[0], self.transition[1:]
+            if not self.transition:
+                self.palette_index = self.target_palette_index
+        else:
+            self.frame_palette_index = self.palette_index
+        return self.frame_palette_index
 
     def mutate(self, key):
         if key == ' ':  # Toggle freeze
@@ -201,7 +282,10 @@ class MandalaParams:
         if key == 'l': self.phase_r -= CHANGE_AMOUNT[0] * 3; return 'phase_r', -1
         if key == 'i': self.phase_a += CHANGE_AMOUNT[0] * 3; return 'phase_a', +1
         if key == 'k': self.phase_a -= CHANGE_AMOUNT[0] * 3; return 'phase_a', -1
-        if key == 'p': self.palette_index = (self.palette_index + 1) % len(self.palettes); return 'palette', +1
+        if key == 'p':
+            self.palette_index = self.target_palette_index = (self.palette_index + 1) % len(self.palettes)
+            self.transition = ()
+            return 'palette', +1
         if key == 'f':
             return 'freeze_capture', None
         if key == 'c':
@@ -214,8 +298,7 @@ class MandalaParams:
             self.randomize()
             return 'randomize', None
         if key in '12345678':
-            self.target_palette_index = int(key) - 1
-            self.transition_frames = 30  # Palette transition over 30 frames
+            self.start_transition(int(key) - 1)  # Palette transition over 30 frames
             return 'palette', 0
         if key == '+':
             return 'speed_up', None
@@ -223,21 +306,10 @@ class MandalaParams:
             return 'slow_down', None
         if key == 'h':
             return 'help', None
+        if key == 't':
+            return 'toggle_stats', None
         return None, None
 
-    def get_blended_palette(self):
-        if self.transition_frames == 0:
-            return self.palettes[self.palette_index]
-        src = self.palettes[self.palette_index]
-        tgt = self.palettes[self.target_palette_index]
-        blend = []
-        for a, b in zip(src, tgt):
-            blend.append(b if self.transition_frames < 10 else a)
-        self.transition_frames -= 1
-        if self.transition_frames == 0:
-            self.palette_index = self.target_palette_index
-        return blend
-    
     def randomize(self):
         self.freq_r = random.uniform(0.1, 1.5)
         self.freq_a = random.uniform(1.0, 6.0)
@@ -246,152 +318,134 @@ class MandalaParams:
         self.offset_x = random.randint(-5, 5)
         self.offset_y = random.randint(-5, 5)
         # self.target_palette_index = random.randint(0, len(self.palettes) - 1)
-        self.transition_frames = 30
+        self.start_transition(self.target_palette_index)
 
-def generate_frame(params, frame_count):
+def generate_frame(params, frame_count, palette=None):
     """
     Generates a single ASCII mandala frame and its corresponding RGB color matrix.
 
     Args:
         params (MandalaParams): Current mandala parameters including frequencies, phases, offsets, and palette.
         frame_count (int): Frame number used for animation and color shifting.
+        palette (np.ndarray): Palette snapshot for this frame, params.palette when omitted.
 
     Returns:
         tuple:
-            frame (list[list[str]]): 2D grid of ASCII characters for each position.
-            color (list[list[tuple[int, int, int]]]): 2D grid of RGB tuples for each character position.
+            frame (np.ndarray): HxW array of ASCII characters for each position.
+            color (np.ndarray): HxWx3 uint8 array of RGB values for each character position.
 
-    The function computes each cell's value using polar coordinates and trigonometric transformations,
-    maps the result to a character from the current palette, and generates a corresponding RGB color
-    for dynamic, animated rendering.
+    The whole grid is computed in one vectorized pass by MandalaEngine, which maps each cell's
+    polar-coordinate value to a palette index and a hue-cycled RGB color.
     """
+    if palette is None:
+        palette = params.palette
+    index, color = engine.generate(params, frame_count, len(palette))
+    return palette[index], color
 
-    center_x = WIDTH // 2
-    center_y = HEIGHT // 2
-    hue_shift = frame_count * 2
-    frame = [[' '] * WIDTH for _ in range(HEIGHT)]
-    color = [[(255,255,255)] * WIDTH for _ in range(HEIGHT)]
-
-    for y in range(HEIGHT):
-        for x in range(WIDTH):
-            dx = x - center_x + params.offset_x
-            dy = y - center_y + params.offset_y
-            r = math.sqrt(dx*dx + dy*dy)
-            angle = math.atan2(dy, dx)
-            val = math.sin(r * params.freq_r + params.phase_r) + math.cos(angle * params.freq_a + params.phase_a)
-            index = int((val + 2) / 4 * len(params.palette))
-            frame[y][x] = params.palette[index % len(params.palette)]
-
-            hue = int((r / (WIDTH / 2)) * 255 + hue_shift) % 256
-            red   = int((math.sin(hue * 0.03) + 1) * 127)
-            green = int((math.sin(hue * 0.05 + 2) + 1) * 127)
-            blue  = int((math.sin(hue * 0.07 + 4) + 1) * 127)
-            color[y][x] = (red, green, blue)
-    return frame, color
-
-def render_frame(prev, curr, colors):
-    RESERVED_LINES = 1  # Lines reserved for controls and status
-    for y in range(HEIGHT - RESERVED_LINES):
-        for x in range(WIDTH):
-            if curr[y][x] != prev[y][x]:
-                r, g, b = colors[y][x]
-                sys.stdout.write(f"\033[{y+3};{x+1}H\033[38;2;{r};{g};{b}m{curr[y][x]}")
-                prev[y][x] = curr[y][x]
-    sys.stdout.write("\033[0m")
-    sys.stdout.flush()
+def snapshot_params(params, palette_index, frame_count):
+    # Immutable copy of the frame's parameters, handed to the producer instead of the live MandalaParams
+    return LoggedParams(frame_count, params.freq_r, params.freq_a, params.phase_r, params.phase_a,
+                        params.offset_x, params.offset_y, palette_index)
 
-from PIL import Image, ImageDraw, ImageFont
-
-def save_frame_as_png(frame, colors, font_path, filename="mandala_capture.png"):
-    char_width, char_height = 10, 18  # adjust for font size
-    img_width = WIDTH * char_width
-    img_height = HEIGHT * char_height
-    image = Image.new("RGB", (img_width, img_height), (0, 0, 0))
-    draw = ImageDraw.Draw(image)
-
-    try:
-        font = ImageFont.truetype(font_path, 14)
-    except:
-        font = ImageFont.load_default()
-
-    for y in range(HEIGHT):
-        for x in range(WIDTH):
-            ch = frame[y][x]
-            r, g, b = colors[y][x]
-            draw.text((x * char_width, y * char_height), ch, fill=(r, g, b), font=font)
+def produce_frame(emitter, request, mark=None):
+    """
+    Generates and encodes one requested frame, inline or in the pipeline's worker thread.
 
-    image.save(filename)
+    Args:
+        emitter (AnsiEmitter): Terminal emitter, only encoded here, written by the caller.
+        request (tuple): (params snapshot, palette, draw, capture, lod) of the frame, lod is (step, color_interval).
+        mark (callable): FrameTimer.mark when run inline, stage timers are not shared with the worker thread.
 
-def save_frame_as_png_sequence(frame, colors, font_path, output_dir="frames"):
-    char_width, char_height = 10, 18
-    img = Image.new("RGB", (WIDTH * char_width, HEIGHT * char_height), (0, 0, 0))
-    draw = ImageDraw.Draw(img)
+    Returns:
+        tuple: (chars, colors, index, hue, data) grids of the frame and its ANSI bytes (None when not drawn),
+        or None when the frame is neither drawn nor captured.
+    """
+    snapshot, palette, draw, capture, lod = request
+    if not (draw or capture):  # Dropped frame, only the animation advances
+        return None
+    engine.set_lod(*lod)  # Set here so the engine is only touched by the thread that produces frames
+    chars, colors = generate_frame(snapshot, snapshot.frame_count, palette)
+    index = engine.indices(snapshot, len(palette))  # Cached by the generate call above
+    hue = engine.hues(snapshot, snapshot.frame_count)
+    if mark:
+        mark("generate")
+    data = emitter.encode(chars, colors, hue) if draw else None  # Hue grid maps straight to the color mode's codes
+    if mark:
+        mark("encode")
+    return chars, colors, index, hue, data
 
-    try:
-        font = ImageFont.truetype(font_path, 14)
-    except:
-        font = ImageFont.load_default()
+def save_frame_as_png(frame, colors, font_path, filename="mandala_capture.png"):
+    from mandala_capture import render_image
+    render_image(frame, colors, font_path).save(filename)
 
-    for y in range(HEIGHT):
-        for x in range(WIDTH):
-            ch = frame[y][x]
-            r, g, b = colors[y][x]
-            draw.text((x * char_width, y * char_height), ch, fill=(r, g, b), font=font)
+def captured_frames(palettes):
+    # (chars, hue) grids of the capture buffer, the ring file with --ring or the in-memory list
+    if frame_ring[0] is not None:
+        return frame_ring[0].iter_frames(palettes)
+    return frames
 
+def save_frame_as_png_sequence(font_path, palettes, output_dir="frames"):
+    from mandala_capture import render_image
     os.makedirs(output_dir, exist_ok=True)
-    
-    for i, img in enumerate(frames):
-        filename = os.path.join(output_dir, f"frame_{i:04d}.png")
-        img.save(filename)
 
-def capture_frame(frame, colors, font_path, palette):
-    from PIL import Image, ImageDraw, ImageFont
-    char_width, char_height = 10, 18
-    img = Image.new("RGB", (WIDTH * char_width, HEIGHT * char_height), (0, 0, 0))
-    draw = ImageDraw.Draw(img)
-    try:
-        font = ImageFont.truetype(font_path, 14)
-    except:
-        font = ImageFont.load_default()
-    
-    for y in range(HEIGHT):
-        for x in range(WIDTH):
-            ch = frame[y][x]
-            r, g, b = colors[y][x]
-            draw.text((x * char_width, y * char_height), ch, fill=(r, g, b), font=font)
-
-    frames.append(img)
-
-def export_gif():
-    if not frames:
+    for i, (frame, hue) in enumerate(captured_frames(palettes)):
+        filename = os.path.join(output_dir, f"frame_{i:04d}.png")
+        render_image(frame, HUE_RGB[hue], font_path).save(filename)
+
+def capture_frame(frame, hue, font_path, palette):
+    # Captured frames are kept as char/hue grids and rendered through the shared glyph atlas on export
+    from mandala_capture import render_image, render_indexed_image
+    writer = stream_writer[0]
+    if writer is None:
+        frames.append((frame, hue))
+    elif args.stream == "gif":
+        writer.write(render_indexed_image(frame, hue, font_path, palette))
+    else:
+        writer.write(render_image(frame, HUE_RGB[hue], font_path, palette))
+
+def log_frame(snapshot):
+    # One fixed-size record per frame, the frame is re-rendered from it by mandala_replay.py
+    stream_writer[0].write(snapshot, snapshot.palette_index, snapshot.frame_count)
+
+def ring_frame(snapshot, index, hue):
+    # The palette-index grid is the engine's cached result for this frame, no recomputation
+    frame_ring[0].append(index, hue, snapshot.palette_index, snapshot.frame_count)
+
+def toggle_capture(params):
+    from mandala_capture import open_stream_writer
+    from mandala_replay import ParamLogWriter
+    recording[0] = not recording[0]
+    if args.stream == "log" and recording[0]:
+        filename = f"mandala_{time.strftime('%Y%m%d_%H%M%S')}.mlog"
+        stream_writer[0] = ParamLogWriter(filename, WIDTH, HEIGHT, FPS, params.palettes)
+    elif args.stream and recording[0]:
+        try:
+            stream_writer[0] = open_stream_writer(args.stream, FPS)
+            capture_error[0] = None
+        except RuntimeError as e:  # No ffmpeg: keep animating without recording
+            recording[0] = False
+            capture_error[0] = str(e)
+    elif not recording[0]:
+        close_stream()
+
+def close_stream():
+    if stream_writer[0]:
+        stream_writer[0].close()
+        stream_writer[0] = None
+
+def export_gif(font_path, palettes, filename=None):
+    if stream_writer[0]:  # Streamed recordings are already on disk, just finalize the file
+        recording[0] = False
+        close_stream()
         return
-    timestamp = time.strftime("%Y%m%d_%H%M%S")
-    filename = f"mandala_{timestamp}.gif"  # Timestamped filename
-    duration_ms = max(1, int(round(1000 / FPS)))  # 1 ms minimum
-    """ frames[0].save(
-        filename,  # output filename
-        save_all=True,  # Save all frames
-        append_images=frames[1:],   # Append all captured frames
-        duration=duration_ms,  # Duration per frame in ms
-        loop=0,  # Loop forever
-        optimize=False,  # Optimize GIF size (rendering), disabled because it loses quality
-        transparency=0  # Set transparency color index
-    ) """
-    paletted_frames = []
-    for img in frames:
-        paletted = img.convert("P", palette=Image.ADAPTIVE, colors=256)
-        paletted_frames.append(paletted)
-
-    paletted_frames[0].save(
-        filename,
-        save_all=True,
-        append_images=paletted_frames[1:],
-        duration=duration_ms,
-        loop=0,
-        optimize=False,
-        transparency=0
-    )
-    frames.clear()
+    if not frames and not (frame_ring[0] is not None and len(frame_ring[0])):
+        return
+    from mandala_capture import open_stream_writer, render_indexed_image
+    # Frames are written against one global palette built from the hue table, no per-frame quantization
+    with open_stream_writer("gif", FPS, filename) as writer:  # Timestamped name in the cwd by default
+        for frame, hue in captured_frames(palettes):
+            writer.write(render_indexed_image(frame, hue, font_path))
+    frames.clear()  # The ring keeps its frames, it always holds the last N seconds
 
 # --- Display currently used settings ---
 def display_settings(params, active_param, frozen, recording):
@@ -406,30 +460,109 @@ def display_settings(params, active_param, frozen, recording):
     frozen_text = "⏸ frozen" if frozen else "▶ running"
     palette_preview = ''.join(params.palette)
     recording_text = "🎥 recording" if recording[0] else "⏹ not recording"
-    recording_text += f" ({len(frames)} frames captured)"
+    if frame_ring[0] is not None:
+        captured = len(frame_ring[0])
+    else:
+        captured = stream_writer[0].frames if stream_writer[0] else len(frames)
+    recording_text += f" ({captured} frames captured)"
+    if capture_error[0]:
+        recording_text += f" ⚠️ {capture_error[0]}"
     sys.stdout.write(f"\033[{HEIGHT+2};1H\033[2K\033[0m")  # Clear line below settings
     sys.stdout.write(f"🧵 Palette: {palette_preview}  {frozen_text} {recording_text} Font: {params.font_name}")
     sys.stdout.flush()
 
-def main():
+def parse_animation(spec):
+    # "phase_a" animates upwards, "phase_a:-1" downwards
+    from mandala_render import ANIMATION_STEPS
+    name, _, direction = spec.partition(":")
+    if name not in ANIMATION_STEPS:
+        raise argparse.ArgumentTypeError(f"unknown parameter {name!r}, choose from {', '.join(ANIMATION_STEPS)}")
+    try:
+        return name, int(direction or 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"direction of {name} must be an integer")
+
+def render_main(argv):
+    # Headless rendering: no terminal or keyboard, frames are rendered by a process pool straight to a file
+    from mandala_render import render_records, trajectory
+    render_parser = argparse.ArgumentParser(
+        prog="ascii_mandala.py render", description="Render a parameter trajectory offline to PNG frames, GIF or MP4")
+    render_parser.add_argument("output", help="Output .gif, .mp4 (needs ffmpeg) or a directory for a PNG sequence")
+    render_parser.add_argument("--width", type=int, default=120, help="Width in characters")
+    render_parser.add_argument("--height", type=int, default=40, help="Height in characters")
+    render_parser.add_argument("--frames", type=int, default=300, help="Number of frames to render")
+    render_parser.add_argument("--fps", type=int, default=30, help="Frame rate of the output")
+    render_parser.add_argument("--palette", type=int, default=1, help="Palette index (1–8)")
+    render_parser.add_argument("--seed", type=int, help="Random seed for start parameters that are not given")
+    render_parser.add_argument("--animate", type=parse_animation, nargs="*", default=[("phase_a", 1)],
+                               metavar="PARAM[:DIR]",
+                               help="Parameters to animate, e.g. phase_a freq_r:-1 (default: phase_a)")
+    render_parser.add_argument("--rate", type=float, default=0.05, help="Change amount per frame")
+    for name in ("freq_r", "freq_a", "phase_r", "phase_a"):
+        render_parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=float, help=f"Start value of {name}")
+    for name in ("offset_x", "offset_y"):
+        render_parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=int, help=f"Start value of {name}")
+    render_parser.add_argument("--font", help="Font used for rendering (default: best font in fonts/)")
+    render_parser.add_argument("--jobs", type=int, help="Worker processes (default: CPU count)")
+    render_args = render_parser.parse_args(argv)
+
+    from mandala_capture import ffmpeg_available
+    if render_args.output.lower().endswith(".mp4") and not ffmpeg_available():
+        render_parser.error("ffmpeg not found on PATH, MP4 output needs ffmpeg")
+
+    random.seed(render_args.seed)
+    params = MandalaParams(palette_index=render_args.palette - 1)
+    for name in ("freq_r", "freq_a", "phase_r", "phase_a", "offset_x", "offset_y"):
+        if getattr(render_args, name) is not None:
+            setattr(params, name, getattr(render_args, name))
+    font_path = render_args.font or find_best_font(params.palettes, verbose=False) or DEFAULT_FONT
+
+    records = trajectory(params, dict(render_args.animate), render_args.rate, render_args.frames, params.palette_index)
+    start_time = time.time()
+
+    def progress(count):
+        sys.stdout.write(f"\r🎞 {count}/{render_args.frames} frames")
+        sys.stdout.flush()
+    count = render_records(records, render_args.width, render_args.height, render_args.fps, params.palettes,
+                           render_args.output, font_path, render_args.jobs, progress=progress)
+    elapsed = time.time() - start_time
+    print(f"\n✅ Rendered {count} frames in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f} fps)"
+          f" → {render_args.output}")
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "render":
+        return render_main(argv[1:])
+    configure(parser.parse_args(argv))
     params = MandalaParams(palette_index=args.palette - 1)
-    prev_frame = [[' '] * WIDTH for _ in range(HEIGHT)]
+    # Frame starts below the two control lines
+    emitter = AnsiEmitter(WIDTH, HEIGHT - 1, row_offset=3, color_mode=args.colors)
     active_param = None
     active_direction = 0  # no animation until a key sets it
     frame_count = 0
     frozen = True  # Start frozen until user interaction)
-    # Select font that supports the most characters in all palettes
-    best_font_path = find_best_font(params.palettes)
-    input("Press Enter to continue...")  # Wait for a key press before proceeding
-    sys.stdout.write("\033[2J\033[H")  # Clear screen and move cursor to home
-    sys.stdout.flush()
+    # Select font that supports the most characters in all palettes, in the background so the first frame is not delayed
+    start_font_selection(params)
+    setup_terminal()
     # Show controls
     show_controls_inline()
-    params.font_name = os.path.splitext(os.path.basename(best_font_path))[0]
+    if args.ring:
+        from mandala_capture import FrameRing
+        frame_ring[0] = FrameRing(args.ring_file, max(1, int(args.ring * FPS)), WIDTH, HEIGHT)
+        recording[0] = True  # The ring records continuously, c pauses it
+    timer = FrameTimer(trace=open_trace(args.trace) if args.trace else None)
+    scheduler = FrameScheduler(FPS, args.frame_policy)
+    lod = LodController(DELAY) if args.lod else None
+    pipeline = FramePipeline(lambda request: produce_frame(emitter, request), args.pipeline) if args.pipeline else None
+    show_stats = args.stats
+    frame_bytes = 0
+    curr_frame = colors = None  # Last frame shown, for f
 
     try:
         for _ in range(FRAMES):  # Animate for a set number of frames
-            start_time = time.time()  # Timer: count how long this function takes to execute
+            draw = scheduler.begin_frame()  # False when this frame is late and its output is skipped
+            timer.start_frame()
             key = get_key()
             if key:
                 param, direction = params.mutate(key)
@@ -440,24 +573,28 @@ def main():
                     CHANGE_AMOUNT[0] *= 1.2
                 elif param == 'slow_down':
                     CHANGE_AMOUNT[0] /= 1.2
-                elif param == 'freeze_capture':
+                elif param == 'freeze_capture' and curr_frame is not None:
                     import datetime
                     filename = f"mandala_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-                    save_frame_as_png(curr_frame, colors, best_font_path, filename)
+                    save_frame_as_png(curr_frame, colors, selected_font(), filename)
                 elif param == 'toggle_capture':
-                    recording[0] = not recording[0]
+                    toggle_capture(params)
                 elif param == 'export_gif':
-                    export_gif()
+                    export_gif(selected_font(), params.palettes)
                 elif param == 'export_png_sequence':
-                    save_frame_as_png_sequence(curr_frame, colors, frame_count, best_font_path)
+                    save_frame_as_png_sequence(selected_font(), params.palettes)
                 elif param == 'quit':
                     break
                 elif param == 'help':
                     show_controls_inline()
+                elif param == 'toggle_stats':
+                    show_stats = not show_stats
+                    sys.stdout.write(f"\033[{HEIGHT+5};1H\033[2K")  # Clear the overlay line
                 elif param:
                     if param not in ['palette', 'randomize']:  # prevent palette and randomize from being animated
                         active_param = param
                         active_direction = direction
+            timer.mark("input")
 
             # Animate active parameters when not frozen
             if not frozen and active_param and active_direction:
@@ -468,25 +605,60 @@ def main():
                 elif active_param == 'phase_a': params.phase_a += delta * 3
                 elif active_param == 'offset_x': params.offset_x += int(delta * 10)
                 elif active_param == 'offset_y': params.offset_y += int(delta * 10)
-
-            curr_frame, colors = generate_frame(params, frame_count)
-            display_settings(params, active_param, frozen, recording)
-            render_frame(prev_frame, curr_frame, colors)
-            if recording[0]:
-                capture_frame(curr_frame, colors, font_path=best_font_path, palette=params.palette)
-            sleep_time = max(0, DELAY - (time.time() - start_time))  # Adjust sleep to maintain consistent FPS. Ensure sleep time is non-negative.
-            time.sleep(sleep_time)
-            # start_time = time.time()  # Reset timer for next frame
-            percentleft = int(round((sleep_time / DELAY) * 100))
-            sys.stdout.write(f"\033[{HEIGHT+4};1H\033[2KFrame time left: {percentleft}% - {sleep_time:.4f}s")
-            sys.stdout.flush()
+            timer.mark("animate")
+
+            palette_index = params.next_palette_index()  # The frame's one palette snapshot
+            palette = params.palettes[palette_index]
+            # Captures keep every frame, dropped frames only skip the terminal
+            request = (snapshot_params(params, palette_index, frame_count), palette, draw, recording[0],
+                       lod.lod if lod else (1, 1))
+            if pipeline:
+                pipeline.submit(request)  # Produced in the worker while the previous frame is written below
+                finished = [pipeline.take()] if pipeline.ready() else []
+                timer.mark("generate")  # With --pipeline this is the time spent waiting for the producer
+            else:
+                finished = [(request, produce_frame(emitter, request, timer.mark))]
+            for (snapshot, frame_palette, frame_draw, frame_capture, _), result in finished:
+                if result is None:
+                    continue
+                curr_frame, colors, index, hue, data = result
+                if frame_draw:
+                    display_settings(params, active_param, frozen, recording)
+                    frame_bytes = emitter.write(data)
+                    timer.mark("write")
+                if frame_capture and recording[0] and args.stream == "log":
+                    log_frame(snapshot)
+                elif frame_capture and recording[0] and frame_ring[0] is not None:
+                    ring_frame(snapshot, index, hue)
+                elif frame_capture and recording[0]:
+                    capture_frame(curr_frame, hue, font_path=selected_font(), palette=frame_palette)
+                timer.mark("capture")
+            sleep_time = scheduler.end_frame()  # Sleeps until this frame's absolute deadline
+            if lod and draw:
+                lod.update(scheduler.work_time)
+            timer.mark("sleep")
+            if draw:
+                percentleft = int(round((sleep_time / DELAY) * 100))
+                sys.stdout.write(f"\033[{HEIGHT+4};1H\033[2KFrame time left: {percentleft}% - {sleep_time:.4f}s - "
+                                 f"{frame_bytes} bytes/frame - {scheduler.status()}"
+                                 + (f" - {lod.status()}" if lod else ""))
+                # Percentiles over the rolling window, no need to redo them every frame
+                if show_stats and frame_count % 10 == 0:
+                    sys.stdout.write(f"\033[{HEIGHT+5};1H\033[2K{timer.summary()}")
+                sys.stdout.flush()
+                timer.mark("write")
+            timer.end_frame()
             frame_count += 1
     except KeyboardInterrupt:
         pass
     finally:
-        if not IS_WINDOWS:
-            termios.tcsetattr(sys.stdin, termios.TCSADRAIN, original_settings)
-        sys.stdout.write("\033[?25h\033[0m\n")  # Show cursor, reset
-        sys.stdout.flush()
-
-main()
\ No newline at end of file
+        if pipeline:
+            pipeline.close()
+        timer.close()
+        close_stream()
+        if frame_ring[0] is not None:
+            frame_ring[0].close()
+        restore_terminal()
+
+if __name__ == "__main__":
+    main()
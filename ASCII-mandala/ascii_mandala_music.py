@@ -1,6 +1,9 @@
 import math, random, sys, time, argparse, platform
-import numpy as np
-import sounddevice as sd
+
+from mandala_ansi import COLOR_MODES, AnsiEmitter
+from mandala_audio import DEFAULT_MAP, GAIN, AudioAnalyzer, AudioModulation, open_audio_source, parse_audio_map
+from mandala_engine import MandalaEngine, palette_array
+from mandala_timing import FrameScheduler, LodController
 
 # OS detection
 IS_WINDOWS = platform.system() == "Windows"
@@ -17,19 +20,50 @@ parser.add_argument("fps", type=int, nargs="?", default=60)
 parser.add_argument("frames", type=int, nargs="?", default=1000)
 parser.add_argument("change_count", type=int, nargs="?", default=1)
 parser.add_argument("change_amount", type=float, nargs="?", default=0.05)
-args = parser.parse_args()
+parser.add_argument("--frame-policy", choices=["drop", "slow"], default="drop",
+                    help="On overrun: drop = skip drawing late frames to stay in sync with the audio, slow = slow down")
+parser.add_argument("--audio", default="device", metavar="SOURCE",
+                    help="Audio input: device (loopback/microphone), synth (test signal) or a .wav file")
+GAIN_HELP = f"Audio level = RMS * GAIN, clipped to 1 (default {GAIN:g}, the old fixed scaling was RMS * 100)"
+parser.add_argument("--gain", type=float, default=GAIN, help=GAIN_HELP)
+MAP_HELP = ("Audio to parameter mapping, SOURCE is bass/mid/treble/level/onset, "
+            "PARAM freq_r/freq_a/phase_r/phase_a/palette. "
+            "Bands swing the parameter by up to AMOUNT, onsets step it by AMOUNT. --map without values turns it off")
+parser.add_argument("--map", nargs="*", default=list(DEFAULT_MAP), metavar="SOURCE:PARAM[:AMOUNT]", help=MAP_HELP)
+parser.add_argument("--colors", choices=COLOR_MODES, default="truecolor",
+                    help="Terminal color mode, 256 and 16 send far fewer bytes over slow links and tmux")
+parser.add_argument("--lod", action="store_true",
+                    help="Adaptive level of detail: compute fewer cells and update colors less often "
+                         "when frames overrun")
+
+def configure(options):
+    # Sets the module settings from parsed arguments, the defaults apply when imported as a module
+    global args, WIDTH, HEIGHT, FPS, FRAMES, CHANGE_COUNT, CHANGE_AMOUNT, DELAY, engine
+    args = options
+    WIDTH, HEIGHT = args.width, args.height
+    FPS, FRAMES = args.fps, args.frames
+    CHANGE_COUNT, CHANGE_AMOUNT = args.change_count, args.change_amount
+    DELAY = 1.0 / FPS
+    engine = MandalaEngine(WIDTH, HEIGHT)
 
-WIDTH, HEIGHT = args.width, args.height
-FPS, FRAMES = args.fps, args.frames
-CHANGE_COUNT, CHANGE_AMOUNT = args.change_count, args.change_amount
-DELAY = 1.0 / FPS
+configure(parser.parse_args([]))
 
 # Terminal setup
-if not IS_WINDOWS:
-    original_settings = termios.tcgetattr(sys.stdin)
-    tty.setcbreak(sys.stdin.fileno())
-sys.stdout.write("\033[?25l\033[2J")  # Hide cursor, clear screen
-sys.stdout.flush()
+original_settings = None
+
+def setup_terminal():
+    global original_settings
+    if not IS_WINDOWS:
+        original_settings = termios.tcgetattr(sys.stdin)
+        tty.setcbreak(sys.stdin.fileno())
+    sys.stdout.write("\033[?25l\033[2J")  # Hide cursor, clear screen
+    sys.stdout.flush()
+
+def restore_terminal():
+    if not IS_WINDOWS and original_settings is not None:
+        termios.tcsetattr(sys.stdin, termios.TCSADRAIN, original_settings)
+    sys.stdout.write("\033[?25h\033[0m\n")  # Show cursor, reset
+    sys.stdout.flush()
 
 def get_key():
     if IS_WINDOWS:
@@ -39,6 +73,7 @@ def get_key():
         return sys.stdin.read(1) if dr else None
 
 def auto_select_loopback():
+    import sounddevice as sd
     print("🎬 Mandala engine starting...")
     devices = sd.query_devices()
     # List all devices for debugging
@@ -55,18 +90,28 @@ def auto_select_loopback():
     print("⚠️ No loopback device found. Falling back to microphone.")
     return False
 
-def get_audio_level():
-    duration = 0.05
-    sample_rate = 44100
-    try:
-        audio = sd.rec(int(duration * sample_rate), samplerate=sample_rate, channels=1, blocking=True)
-        rms = np.sqrt(np.mean(audio**2))
-        level = min(rms * 100, 1.0)
-        print(f"🔊 Audio level: {level:.3f}")
-        return level
-    except Exception as e:
-        print(f"Audio error: {e}")
-        return 0.0
+def start_audio(spec, gain=GAIN):
+    # Audio blocks arrive on the source's own thread (sounddevice callback or a paced WAV/synth thread),
+    # the render loop only reads the latest level
+    if spec == "device":
+        import sounddevice as sd
+        auto_select_loopback()
+        print(f"Using device: {sd.query_devices(sd.default.device)['name']}")
+    source = open_audio_source(spec, gain=gain)
+    source.start()
+    return source
+
+PALETTES = tuple(palette_array(chars) for chars in [  # Immutable arrays, frames index them directly
+    [' ', '.', '*', '+', 'x', 'X', 'o', 'O', '@', '#'],
+    [' ', '-', '=', '~', '^', '*', '%', '$', '&', '#'],
+    [' ', '.', ':', ';', '!', '?', '/', '|', '\\', '#'],
+    [' ', '·', '•', '*', '¤', '°', '○', '●', '◎', '■'],
+    [' ', '˙', '⁕', '✦', '✧', '✶', '✷', '✸', '✺', '✹'],
+    [' ', '·', '•', '◦', '○', '◉', '◎', '◍', '◯', '⬤'],
+    [' ', '░', '▒', '▓', '▙', '▛', '▜', '▟', '█', '🟥'],
+    [' ', '⎯', '⎼', '⎻', '﹏', '╌', '╍', '╏', '╎', '╳'],
+    [' ', '☉', '☼', '☽', '☾', '♒', '♓', '♈', '♊', '♋']
+])
 
 class MandalaParams:
     def __init__(self):
@@ -76,17 +121,7 @@ class MandalaParams:
         self.phase_a = random.uniform(0, math.pi * 2)
         self.offset_x = random.randint(-5, 5)
         self.offset_y = random.randint(-5, 5)
-        self.palettes = [
-            [' ', '.', '*', '+', 'x', 'X', 'o', 'O', '@', '#'],
-            [' ', '-', '=', '~', '^', '*', '%', '$', '&', '#'],
-            [' ', '.', ':', ';', '!', '?', '/', '|', '\\', '#'],
-            [' ', '·', '•', '*', '¤', '°', '○', '●', '◎', '■'],
-            [' ', '˙', '⁕', '✦', '✧', '✶', '✷', '✸', '✺', '✹'],
-            [' ', '·', '•', '◦', '○', '◉', '◎', '◍', '◯', '⬤'],
-            [' ', '░', '▒', '▓', '▙', '▛', '▜', '▟', '█', '🟥'],
-            [' ', '⎯', '⎼', '⎻', '﹏', '╌', '╍', '╏', '╎', '╳'],
-            [' ', '☉', '☼', '☽', '☾', '♒', '♓', '♈', '♊', '♋']
-        ]
+        self.palettes = PALETTES
         self.palette_index = random.randint(0, len(self.palettes) - 1)
 
     @property
@@ -107,63 +142,128 @@ class MandalaParams:
         return None, None
 
 def generate_frame(params, frame_count, audio_level):
-    center_x = WIDTH // 2
-    center_y = HEIGHT // 2
-    hue_shift = frame_count * 2
     brightness = 0.5 + audio_level * 0.5
-    frame = [[' '] * WIDTH for _ in range(HEIGHT)]
-    color = [[(255,255,255)] * WIDTH for _ in range(HEIGHT)]
-
-    for y in range(HEIGHT):
-        for x in range(WIDTH):
-            dx = x - center_x + params.offset_x
-            dy = y - center_y + params.offset_y
-            r = math.sqrt(dx*dx + dy*dy)
-            angle = math.atan2(dy, dx)
-            val = math.sin(r * params.freq_r + params.phase_r) + math.cos(angle * params.freq_a + params.phase_a)
-            index = int((val + 2) / 4 * len(params.palette))
-            frame[y][x] = params.palette[index % len(params.palette)]
-
-            hue = int((r / (WIDTH / 2)) * 255 + hue_shift) % 256
-            red   = int((math.sin(hue * 0.03) + 1) * 127 * brightness)
-            green = int((math.sin(hue * 0.05 + 2) + 1) * 127 * brightness)
-            blue  = int((math.sin(hue * 0.07 + 4) + 1) * 127 * brightness)
-            color[y][x] = (int(red), int(green), int(blue))
-    return frame, color
-
-def render_frame(prev, curr, colors):
-    for y in range(HEIGHT):
-        for x in range(WIDTH):
-            if curr[y][x] != prev[y][x]:
-                r, g, b = colors[y][x]
-                sys.stdout.write(f"\033[{y+1};{x+1}H\033[38;2;{r};{g};{b}m{curr[y][x]}")
-                prev[y][x] = curr[y][x]
-    sys.stdout.write("\033[0m")
-    sys.stdout.flush()
+    palette = params.palette
+    index, color = engine.generate(params, frame_count, len(palette), brightness)
+    return palette[index], color
+
+def render_frame(emitter, curr, colors):
+    return emitter.emit(curr, colors)
 
-def display_settings(params, active_param):
+def display_settings(params, active_param, emitter, scheduler, lod=None, audio=None, modulation=None):
     sys.stdout.write(f"\033[{HEIGHT+1};1H\033[0m")
     sys.stdout.write(
         f"🎛 freq_r={params.freq_r:.2f} freq_a={params.freq_a:.2f} "
         f"phase_r={params.phase_r:.2f} phase_a={params.phase_a:.2f} "
         f"offset_x={params.offset_x} offset_y={params.offset_y} "
         f"palette={params.palette_index + 1}/{len(params.palettes)} "
-        f"→ animating: {active_param or 'none'}"
+        f"→ animating: {active_param or 'none'} "
+        f"{emitter.last_bytes} bytes/frame {scheduler.status()}" + (f" {lod.status()}" if lod else "")
+        + (f"\033[K\n🔊 level={audio.level:.2f} peak={audio.peak:.2f}" if audio else "")
+        + (f" {modulation.status()}" if audio and modulation else "") + "\033[K"
     )
     sys.stdout.flush()
 
-def main():
+def render_main(argv):
+    # Offline music video: the WAV is analyzed at exactly the video frame rate, frames are rendered
+    # by a process pool and the audio is muxed into the MP4, deterministic and faster than realtime
+    from ascii_mandala import DEFAULT_FONT, find_best_font, parse_animation
+    from mandala_audio import analyze_frames, read_wav
+    from mandala_render import ANIMATION_STEPS, FrameParams, render_records
+    render_parser = argparse.ArgumentParser(prog="ascii_mandala_music.py render",
+                                            description="Render an audio-driven mandala video from a WAV file")
+    render_parser.add_argument("wav", help="PCM WAV file")
+    render_parser.add_argument("output",
+                               help="Output .mp4 (needs ffmpeg, gets the audio) or a directory for a PNG sequence. "
+                                    "GIF is not supported, its global palette cannot show the level brightness")
+    render_parser.add_argument("--width", type=int, default=120, help="Width in characters")
+    render_parser.add_argument("--height", type=int, default=40, help="Height in characters")
+    render_parser.add_argument("--fps", type=int, default=30, help="Frame rate of the output")
+    render_parser.add_argument("--seed", type=int, default=0, help="Random seed for the start parameters")
+    render_parser.add_argument("--gain", type=float, default=GAIN, help=GAIN_HELP)
+    render_parser.add_argument("--map", nargs="*", default=list(DEFAULT_MAP), metavar="SOURCE:PARAM[:AMOUNT]",
+                               help=MAP_HELP)
+    render_parser.add_argument("--animate", type=parse_animation, nargs="*", default=[], metavar="PARAM[:DIR]",
+                               help="Parameters that also drift at --rate per frame, e.g. phase_a freq_r:-1")
+    render_parser.add_argument("--rate", type=float, default=0.01, help="Change amount per frame for --animate")
+    render_parser.add_argument("--font", help="Font used for rendering (default: best font in fonts/)")
+    render_parser.add_argument("--jobs", type=int, help="Worker processes (default: CPU count)")
+    render_args = render_parser.parse_args(argv)
+
+    animate = dict(render_args.animate)
+    try:
+        mapping = parse_audio_map(render_args.map)
+    except ValueError as e:
+        render_parser.error(str(e))
+
+    from mandala_capture import ffmpeg_available
+    if render_args.output.lower().endswith(".gif"):
+        render_parser.error("GIF output cannot show the level-driven brightness, use .mp4 or a PNG sequence directory")
+    if render_args.output.lower().endswith(".mp4") and not ffmpeg_available():
+        render_parser.error("ffmpeg not found on PATH, MP4 output needs ffmpeg")
+
+    samples, samplerate = read_wav(render_args.wav)
+    random.seed(render_args.seed)
+    params = MandalaParams()
+    analyzer = AudioAnalyzer(samplerate)
+    modulation = AudioModulation(mapping, analyzer)
+
+    def records():
+        # Analysis and parameter updates run in order in this process, only rendering is parallel
+        levels = analyze_frames(samples, samplerate, render_args.fps, analyzer, render_args.gain)
+        for frame_count, level in enumerate(levels):
+            for name, direction in animate.items():
+                delta = render_args.rate * direction * ANIMATION_STEPS[name]
+                setattr(params, name, getattr(params, name) + (int(delta) if name.startswith("offset") else delta))
+            modulation.apply(params, level)
+            yield FrameParams(frame_count, params.freq_r, params.freq_a, params.phase_r, params.phase_a,
+                              params.offset_x, params.offset_y, params.palette_index,
+                              0.5 + level * 0.5)  # Same brightness as generate_frame
+
+    if render_args.font:
+        font_path = render_args.font
+    else:
+        font_path = find_best_font(PALETTES, verbose=False) or DEFAULT_FONT
+    duration = len(samples) / samplerate
+    total = math.ceil(len(samples) * render_args.fps / samplerate)
+    start_time = time.time()
+
+    def progress(count):
+        sys.stdout.write(f"\r🎞 {count}/{total} frames")
+        sys.stdout.flush()
+    count = render_records(records(), render_args.width, render_args.height, render_args.fps, PALETTES,
+                           render_args.output, font_path, render_args.jobs, progress=progress,
+                           audio=render_args.wav if render_args.output.lower().endswith(".mp4") else None)
+    elapsed = time.time() - start_time
+    print(f"\n✅ Rendered {count} frames ({duration:.1f}s of audio) in {elapsed:.1f}s "
+          f"({duration / max(elapsed, 1e-9):.1f}x realtime) → {render_args.output}")
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "render":
+        return render_main(argv[1:])
+    configure(parser.parse_args(argv))
+    setup_terminal()
     print("✅ Script started")
+    audio = None
     try:
-        auto_select_loopback()
-        print(f"Using device: {sd.query_devices(sd.default.device)['name']}")
+        mapping = parse_audio_map(args.map)
+        audio = start_audio(args.audio, args.gain)
         params = MandalaParams()
-        prev_frame = [[' '] * WIDTH for _ in range(HEIGHT)]
+        analyzer = AudioAnalyzer(audio.samplerate)
+        analyzer.attach(audio)  # Runs on the audio thread, well under a millisecond per block
+        modulation = AudioModulation(mapping, analyzer) if mapping else None
+        emitter = AnsiEmitter(WIDTH, HEIGHT, color_mode=args.colors)
         active_param = None
         active_direction = +1
         frame_count = 0
+        # Absolute deadlines keep the animation in sync with the audio
+        scheduler = FrameScheduler(FPS, args.frame_policy)
+        lod = LodController(DELAY) if args.lod else None
 
         for _ in range(FRAMES):
+            draw = scheduler.begin_frame()
             key = get_key()
             if key:
                 param, direction = params.mutate(key)
@@ -181,16 +281,20 @@ def main():
             elif active_param == 'phase_a': params.phase_a += delta * 3
             elif active_param == 'offset_x': params.offset_x += int(delta * 10)
             elif active_param == 'offset_y': params.offset_y += int(delta * 10)
+            if modulation:
+                modulation.apply(params, audio.level)
 
-            # Get audio level and generate frame
-            # audio_level = get_audio_level()
-            curr_frame, colors = generate_frame(params, frame_count, 1)
+            if draw:  # Late frames still advance the animation but skip generation and output
+                # Latest level computed on the audio thread, reading it never blocks
+                curr_frame, colors = generate_frame(params, frame_count, audio.level)
 
-            # Render and display
-            render_frame(prev_frame, curr_frame, colors)
-            display_settings(params, active_param)
+                # Render and display
+                render_frame(emitter, curr_frame, colors)
+                display_settings(params, active_param, emitter, scheduler, lod, audio, modulation)
 
-            time.sleep(DELAY)
+            scheduler.end_frame()
+            if lod and draw and lod.update(scheduler.work_time):
+                engine.set_lod(*lod.lod)
             frame_count += 1
 
     except KeyboardInterrupt:
@@ -198,10 +302,9 @@ def main():
     except Exception as e:
         print(f"Fatal error: {e}")
     finally:
-        if not IS_WINDOWS:
-            termios.tcsetattr(sys.stdin, termios.TCSADRAIN, original_settings)
-        sys.stdout.write("\033[?25h\033[0m\n")  # Show cursor, reset
-        sys.stdout.flush()
+        if audio:
+            audio.stop()
+        restore_terminal()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,12 +1,22 @@
+"""
+Font chooser — renders a preview of the mandala palettes for every font in fonts/.
+
+Usage:
+    python font_chooser.py                 # Preview fonts one by one
+    python font_chooser.py --batch         # Process pool, JSON coverage report and contact sheet
+    python font_chooser.py --batch --jobs 8 --report font_report.json --sheet font_sheet.png
+
+Batch mode skips fonts whose files have not changed since the previous report.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image, ImageDraw, ImageFont
+import argparse
+import json
+import math
 import os
 
-# Testattavat fontit "fonts"-kansiossa
-font_candidates = [
-    os.path.join("fonts", f)
-    for f in os.listdir("fonts")
-    if f.lower().endswith((".ttf", ".otf"))
-]
+from mandala_fonts import FontCoverageIndex, font_signature, list_fonts, read_cmap
 
 # Unicode-merkit joita haluat testata
 test_lines = [
@@ -21,24 +31,22 @@ test_lines = [
     [' ', '⎯', '⎼', '⎻', '﹏', '╌', '╍', '╏', '╎', '╳']
 ]
 
-from fontTools.ttLib import TTFont
+# Fonttien cmap luetaan kerran ja tallennetaan välimuistiin (jaettu ascii_mandala.py:n kanssa)
+font_index = FontCoverageIndex()
 
 def font_has_glyph(font_path, ch):
     try:
-        font = TTFont(font_path)
-        for table in font['cmap'].tables:
-            if ord(ch) in table.cmap:
-                return True
-    except:
-        pass
-    return False
-
-def render_font_preview(font_path, output_file="font_preview.png"):
+        return font_index.has_glyph(font_path, ch)
+    except Exception:
+        return False
+
+def render_font_preview(font_path, output_file="font_preview.png", codepoints=None, verbose=True):
+    # codepoints: fontin merkistö valmiiksi luettuna (rinnakkaisajossa), muuten käytetään font_indexiä
     try:
         font = ImageFont.truetype(font_path, 32)
     except Exception as e:
         print(f"⚠️ Fontin lataus epäonnistui: {font_path} → {e}")
-        return
+        return None
 
     font_name = font.getname()[0]
     char_width, char_height = 40, 50
@@ -61,14 +69,16 @@ def render_font_preview(font_path, output_file="font_preview.png"):
 
             if ch == ' ':
                 draw.text((x, y), ch, font=font, fill=(255, 255, 255))
-            elif not font_has_glyph(font_path, ch):
+            elif not (ord(ch) in codepoints if codepoints is not None else font_has_glyph(font_path, ch)):
                 draw.text((x, y), ch, font=font, fill=(255, 0, 0))  # punainen = ei löydy fontista
                 unsupported.append(ch)
             else:
                 draw.text((x, y), ch, font=font, fill=(255, 255, 255))
 
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
     image.save(output_file)
+    if not verbose:
+        return font_name
     print(f"✅ Renderöity fontti: {font_name} → {output_file}")
     if unsupported:
         print("❌ Merkkejä ei renderöity:")
@@ -77,12 +87,122 @@ def render_font_preview(font_path, output_file="font_preview.png"):
             print(f"  {ch} ({code})")
     else:
         print("✅ Kaikki merkit renderöityivät oikein.")
+    return font_name
 
+def preview_path(font_path):
+    font_name = os.path.splitext(os.path.basename(font_path))[0]
+    return os.path.join(os.path.dirname(font_path), f"{font_name}.png")
 
-for font_file in font_candidates:
-    if os.path.exists(font_file):
-        font_name = os.path.splitext(os.path.basename(font_file))[0]
-        output_file = f"fonts/{font_name}.png"
-        render_font_preview(font_file, output_file)
-    else:
-        print(f"🔍 Fonttitiedostoa ei löytynyt: {font_file}")
+def scan_font(font_path):
+    # Ajetaan työprosessissa: luetaan cmap ja renderöidään esikatselu
+    try:
+        codepoints = read_cmap(font_path)
+    except Exception as e:  # Rikkinäinen fontti ohitetaan, muut jatkavat
+        print(f"⚠️ Fontin lataus epäonnistui: {font_path} → {e}", flush=True)
+        return font_path, None, None
+    font_name = render_font_preview(font_path, preview_path(font_path), codepoints, verbose=False)
+    return font_path, codepoints, font_name
+
+def coverage_entry(font_path, font_name):
+    mtime_ns, size = font_signature(font_path)
+    palettes = []
+    supported = 0
+    for index, line in enumerate(test_lines):
+        missing = font_index.missing(font_path, line)
+        supported += len(line) - len(missing)
+        palettes.append({
+            "index": index,
+            "palette": "".join(line),
+            "missing": [f"U+{ord(ch):04X}" for ch in missing],
+        })
+    return {
+        "name": font_name,
+        "mtime_ns": mtime_ns,
+        "size": size,
+        "preview": preview_path(font_path),
+        "supported": supported,
+        "total": sum(len(line) for line in test_lines),
+        "palettes": palettes,
+    }
+
+def make_contact_sheet(preview_files, output_file):
+    # Kaikki esikatselut samaan kuvaan ruudukoksi
+    images = [Image.open(f).convert("RGB") for f in preview_files if os.path.exists(f)]
+    if not images:
+        return
+    cell_w = max(im.width for im in images)
+    cell_h = max(im.height for im in images)
+    columns = math.ceil(math.sqrt(len(images)))
+    rows = math.ceil(len(images) / columns)
+    sheet = Image.new("RGB", (columns * cell_w, rows * cell_h), (30, 30, 30))
+    for i, im in enumerate(images):
+        sheet.paste(im, ((i % columns) * cell_w, (i // columns) * cell_h))
+    sheet.save(output_file)
+
+def run_batch(font_dir, report_file, sheet_file, jobs=None):
+    fonts = list_fonts(font_dir)
+    previous = {}
+    if os.path.exists(report_file):
+        with open(report_file, encoding="utf-8") as f:
+            previous = json.load(f).get("fonts", {})
+
+    report = {}
+    changed = []
+    for font_path in fonts:
+        entry = previous.get(font_path)
+        unchanged = (
+            entry is not None
+            and (entry["mtime_ns"], entry["size"]) == font_signature(font_path)
+            and os.path.exists(entry["preview"])
+            and font_index.is_current(font_path)
+        )
+        if unchanged:
+            report[font_path] = entry
+        else:
+            changed.append(font_path)
+    print(f"🔍 {len(fonts)} fonttia, {len(changed)} muuttunutta tarkistetaan ({len(fonts) - len(changed)} ohitetaan)")
+
+    if changed:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for font_path, codepoints, font_name in pool.map(scan_font, changed):
+                if font_name is None:
+                    continue
+                font_index.update(font_path, codepoints)
+                report[font_path] = coverage_entry(font_path, font_name)
+                entry = report[font_path]
+                print(f"✅ {font_name}: {entry['supported']}/{entry['total']} merkkiä → {entry['preview']}")
+        font_index.save()
+
+    report = {f: report[f] for f in fonts if f in report}  # Keep fonts in directory order
+    best = max(report, key=lambda f: report[f]["supported"], default=None)
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump({"palettes": ["".join(line) for line in test_lines], "best": best, "fonts": report},
+                  f, ensure_ascii=False, indent=2)
+    make_contact_sheet([entry["preview"] for entry in report.values()], sheet_file)
+    print(f"📄 Raportti: {report_file}  🖼 Kontaktikuva: {sheet_file}")
+    if best:
+        print(f"🏆 Paras fontti: {report[best]['name']} ({report[best]['supported']}/{report[best]['total']})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Render palette previews for fonts")
+    parser.add_argument("--font-dir", default="fonts", help="Directory with .ttf/.otf fonts")
+    parser.add_argument("--batch", action="store_true",
+                        help="Scan fonts in parallel and write a report and a contact sheet")
+    parser.add_argument("--jobs", type=int, help="Worker processes for --batch (default: CPU count)")
+    parser.add_argument("--report", default="font_report.json", help="Coverage report written by --batch")
+    parser.add_argument("--sheet", default="font_contact_sheet.png", help="Contact sheet written by --batch")
+    args = parser.parse_args()
+
+    if args.batch:
+        run_batch(args.font_dir, args.report, args.sheet, args.jobs)
+        return
+
+    for font_file in list_fonts(args.font_dir):
+        if os.path.exists(font_file):
+            render_font_preview(font_file, preview_path(font_file))
+        else:
+            print(f"🔍 Fonttitiedostoa ei löytynyt: {font_file}")
+    font_index.save()
+
+if __name__ == "__main__":
+    main()
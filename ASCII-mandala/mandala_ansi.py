@@ -0,0 +1,224 @@
+"""
+ANSI frame emitter shared by the mandala scripts.
+
+Diffs each frame against what is already on screen (glyph and color),
+merges horizontally adjacent changed cells into runs that need a single
+cursor move, emits a color sequence only when the color actually changes
+and writes the whole frame with one write call.
+
+Colors can be sent as 24-bit truecolor, xterm-256 or 16-color sequences.
+The reduced modes quantize colors before diffing, so a cell whose color
+moved but still maps to the same terminal color is left alone.
+"""
+
+import sys
+import unicodedata
+
+import numpy as np
+
+from mandala_engine import HUE_RGB
+
+COLOR_MODES = ("truecolor", "256", "16")
+
+
+def _xterm_256_palette():
+    # Colors 16..255: the 6x6x6 cube and the 24-step gray ramp. 0..15 are left out, terminals theme them.
+    levels = [0, 95, 135, 175, 215, 255]
+    cube = [(r, g, b) for r in levels for g in levels for b in levels]
+    grays = [(v, v, v) for v in range(8, 248, 10)]
+    return np.array(cube + grays, dtype=np.int64), list(range(16, 256))
+
+
+def _ansi_16_palette():
+    # xterm default RGB values of the 16 basic colors, SGR 30–37 and 90–97
+    rgb = [
+        (0, 0, 0), (205, 0, 0), (0, 205, 0), (205, 205, 0),
+        (0, 0, 238), (205, 0, 205), (0, 205, 205), (229, 229, 229),
+        (127, 127, 127), (255, 0, 0), (0, 255, 0), (255, 255, 0),
+        (92, 92, 255), (255, 0, 255), (0, 255, 255), (255, 255, 255),
+    ]
+    return np.array(rgb, dtype=np.int64), list(range(16))
+
+
+def _nearest(colors, palette, chunk=4096):
+    # Index of the closest palette entry for each row of colors: |c - p|^2 = |c|^2 - 2 c.p + |p|^2, |c|^2 is
+    # constant per row. Chunked so building the 32k-entry lookup table stays at a few MB.
+    colors = colors.astype(np.float64)
+    palette = palette.astype(np.float64)
+    norms = (palette * palette).sum(axis=1)
+    return np.concatenate([
+        (norms - 2 * colors[i:i + chunk] @ palette.T).argmin(axis=1)
+        for i in range(0, len(colors), chunk)
+    ])
+
+
+class ColorMode:
+    """
+    Maps colors to terminal color codes and their pre-built SGR sequences.
+
+    Args:
+        name (str): "truecolor", "256" or "16".
+
+    Attributes:
+        hue_codes (np.ndarray): Code of each of the 256 hue steps, so hue grids are mapped with one lookup.
+
+    Codes are packed 24-bit RGB in truecolor mode and terminal palette numbers otherwise.
+    Arbitrary RGB (e.g. brightness-scaled colors) goes through a 32x32x32 lookup table
+    that is built on first use.
+    """
+
+    def __init__(self, name="truecolor"):
+        if name not in COLOR_MODES:
+            raise ValueError(f"Unknown color mode: {name}")
+        self.name = name
+        self._rgb_lut = None
+        if name == "truecolor":
+            self._sgr = {}  # Filled on demand, up to 16M codes are possible
+            self.hue_codes = self._pack(HUE_RGB)
+            return
+        palette, numbers = _xterm_256_palette() if name == "256" else _ansi_16_palette()
+        self._palette = palette
+        self._numbers = np.array(numbers, dtype=np.int64)
+        if name == "256":
+            self._sgr = {n: f"\033[38;5;{n}m" for n in numbers}
+        else:
+            self._sgr = {n: f"\033[{30 + n if n < 8 else 90 + n - 8}m" for n in numbers}
+        self.hue_codes = self._numbers[_nearest(HUE_RGB, palette)]
+        self.hue_codes.flags.writeable = False
+
+    @staticmethod
+    def _pack(colors):
+        colors = colors.astype(np.int64)
+        return (colors[..., 0] << 16) | (colors[..., 1] << 8) | colors[..., 2]
+
+    def quantize(self, colors):
+        """Maps an HxWx3 uint8 RGB grid to an HxW grid of codes."""
+        if self.name == "truecolor":
+            return self._pack(colors)
+        if self._rgb_lut is None:
+            steps = np.arange(32) * 8 + 4  # Center of each 5-bit bucket
+            grid = np.stack(np.meshgrid(steps, steps, steps, indexing="ij"), axis=-1).reshape(-1, 3)
+            self._rgb_lut = self._numbers[_nearest(grid, self._palette)]
+        buckets = colors.astype(np.int64) >> 3
+        return self._rgb_lut[(buckets[..., 0] << 10) | (buckets[..., 1] << 5) | buckets[..., 2]]
+
+    def sgr(self, code):
+        """Returns the SGR sequence that selects a code as the foreground color."""
+        sgr = self._sgr.get(code)
+        if sgr is None:  # Truecolor only
+            sgr = self._sgr[code] = f"\033[38;2;{code >> 16};{(code >> 8) & 0xFF};{code & 0xFF}m"
+        return sgr
+
+
+def _is_wide(ch):
+    return unicodedata.east_asian_width(ch) in ("W", "F")
+
+
+class AnsiEmitter:
+    """
+    Encodes and writes frames as minimal ANSI updates.
+
+    Args:
+        width (int): Number of columns to draw.
+        height (int): Number of rows to draw.
+        row_offset (int): Terminal row (1-based) of the first frame row.
+        stream: Text stream to write to, defaults to sys.stdout.
+        color_mode (str): "truecolor", "256" or "16".
+
+    Attributes:
+        last_bytes (int): Size of the most recently emitted frame in bytes.
+        total_bytes (int): Bytes emitted since creation.
+        frames (int): Number of frames emitted.
+    """
+
+    def __init__(self, width, height, row_offset=1, stream=None, color_mode="truecolor"):
+        self.width = width
+        self.height = height
+        self.row_offset = row_offset
+        self.stream = stream
+        self.color_mode = ColorMode(color_mode)
+        self.last_bytes = 0
+        self.total_bytes = 0
+        self.frames = 0
+        self._wide = {}
+        self.reset()
+
+    def reset(self):
+        """Forgets the screen state so the next frame is drawn in full (e.g. after clearing the screen)."""
+        self._chars = np.full((self.height, self.width), " ")
+        self._codes = np.full((self.height, self.width), -1, dtype=np.int64)
+
+    def _is_wide(self, ch):
+        wide = self._wide.get(ch)
+        if wide is None:
+            wide = self._wide[ch] = _is_wide(ch)
+        return wide
+
+    def encode(self, chars, colors, hue=None):
+        """
+        Encodes the difference between the screen and a new frame.
+
+        Args:
+            chars (np.ndarray): HxW array of characters (at least `height` rows).
+            colors (np.ndarray): HxWx3 uint8 RGB array.
+            hue (np.ndarray): HxW hue steps the colors were made from (HUE_RGB[hue]), optional.
+                Mapped through the color mode's hue table instead of quantizing the RGB grid.
+
+        Returns:
+            bytes: UTF-8 encoded ANSI sequence that updates the screen to the new frame.
+        """
+        chars = chars[:self.height]
+        if hue is not None:
+            codes = self.color_mode.hue_codes[hue[:self.height]]
+        else:
+            codes = self.color_mode.quantize(colors[:self.height])
+        # A blank cell looks the same in every color, so only glyph changes matter there
+        changed = (chars != self._chars) | ((codes != self._codes) & (chars != " "))
+        ys, xs = np.nonzero(changed)
+        if len(ys) == 0:
+            return b""
+
+        changed_codes = codes[ys, xs]
+        new_run = np.ones(len(ys), dtype=bool)
+        new_run[1:] = (ys[1:] != ys[:-1]) | (xs[1:] != xs[:-1] + 1)
+        new_color = np.ones(len(ys), dtype=bool)
+        new_color[1:] = changed_codes[1:] != changed_codes[:-1]
+
+        parts = []
+        append = parts.append
+        row_offset = self.row_offset
+        sgr = self.color_mode.sgr
+        prev_wide = False
+        for y, x, ch, code, run, color in zip(ys.tolist(), xs.tolist(), chars[ys, xs].tolist(),
+                                              changed_codes.tolist(), new_run.tolist(), new_color.tolist()):
+            if run or prev_wide:  # The cursor skips two columns after a wide glyph
+                append(f"\033[{y + row_offset};{x + 1}H")
+            if color:
+                append(sgr(code))
+            append(ch)
+            prev_wide = self._is_wide(ch)
+        append("\033[0m")
+
+        self._chars[changed] = chars[changed]
+        self._codes[changed] = codes[changed]
+        return "".join(parts).encode("utf-8")
+
+    def emit(self, chars, colors, hue=None):
+        """Encodes a frame and writes it with a single write call. Returns the number of bytes written."""
+        return self.write(self.encode(chars, colors, hue))
+
+    def write(self, data):
+        """Writes an encoded frame with a single write call. Returns the number of bytes written."""
+        stream = self.stream or sys.stdout
+        buffer = getattr(stream, "buffer", None)
+        if data and buffer is not None:
+            stream.flush()  # Keep ordering with text already written to the stream
+            buffer.write(data)
+            buffer.flush()
+        elif data:
+            stream.write(data.decode("utf-8"))
+            stream.flush()
+        self.last_bytes = len(data)
+        self.total_bytes += len(data)
+        self.frames += 1
+        return self.last_bytes
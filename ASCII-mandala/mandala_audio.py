@@ -0,0 +1,496 @@
+"""
+Streaming audio input for ascii_mandala_music.py.
+
+An audio source delivers fixed-size blocks on its own thread: the
+sounddevice input callback, or a paced thread that reads a WAV file or
+synthesizes a test signal (for machines without audio hardware). Each
+block goes into a single-writer ring buffer and its RMS and peak levels
+are computed right there on the audio thread; analyzers read their FFT window from the
+ring, so it can be longer than one block. The render loop only reads the
+latest values, which costs an attribute lookup and never blocks.
+
+Usage:
+    with open_audio_source("synth") as source:
+        ...
+        level = source.level
+"""
+
+import math
+import threading
+import time
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 44100
+BLOCK_SIZE = 1024  # About 23 ms at 44.1 kHz
+GAIN = 4.0  # Level = RMS * GAIN, clipped to 1
+FFT_SIZE = 2048  # Analysis window, shared by the live and offline paths so they see the same bands
+
+
+class AudioRing:
+    """
+    Single-writer ring buffer of mono float32 samples.
+
+    Only the audio thread calls write(). It fills the samples before it publishes the new
+    total, and the total is a single int assignment, so readers never need a lock. A reader
+    may see the oldest part of its window being overwritten if it asks for nearly the whole
+    capacity, so keep the capacity well above the largest read.
+
+    Args:
+        capacity (int): Number of samples kept.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.samples = np.zeros(capacity, dtype=np.float32)
+        self.written = 0  # Total samples written, the write position is written % capacity
+
+    def write(self, block):
+        block = block[-self.capacity:]
+        start = self.written % self.capacity
+        end = start + len(block)
+        if end <= self.capacity:
+            self.samples[start:end] = block
+        else:
+            split = self.capacity - start
+            self.samples[start:] = block[:split]
+            self.samples[:end - self.capacity] = block[split:]
+        self.written += len(block)
+
+    def latest(self, n):
+        """Returns a copy of the newest n samples (zeros before any audio arrived)."""
+        n = min(n, self.capacity)
+        end = self.written % self.capacity
+        if end >= n:
+            return self.samples[end - n:end].copy()
+        return np.concatenate([self.samples[end - n:], self.samples[:end]])
+
+
+class AudioSource:
+    """
+    Base class of the audio backends: owns the ring buffer and the per-block level analysis.
+
+    Args:
+        samplerate (int): Sample rate in Hz.
+        blocksize (int): Samples per block.
+        seconds (float): Length of audio kept in the ring buffer.
+        gain (float): Level scale, level = RMS * gain clipped to 1.
+
+    Attributes:
+        level (float): RMS level of the latest block, scaled to 0..1.
+        peak (float): Absolute peak of the latest block, clipped to 1 (not scaled by gain).
+        blocks (int): Blocks processed so far.
+        on_block (list[callable]): Called with each block on the audio thread, after the levels.
+    """
+
+    def __init__(self, samplerate=SAMPLE_RATE, blocksize=BLOCK_SIZE, seconds=2.0, gain=GAIN):
+        self.samplerate = samplerate
+        self.gain = gain
+        self.blocksize = blocksize
+        self.ring = AudioRing(int(samplerate * seconds))
+        self.level = 0.0
+        self.peak = 0.0
+        self.blocks = 0
+        self.on_block = []
+
+    def process(self, block):
+        """Handles one mono float32 block, runs on the audio thread."""
+        self.ring.write(block)
+        rms = float(np.sqrt(np.dot(block, block) / len(block))) if len(block) else 0.0
+        self.level = min(rms * self.gain, 1.0)
+        self.peak = min(float(np.abs(block).max()), 1.0) if len(block) else 0.0
+        self.blocks += 1
+        for callback in self.on_block:
+            callback(block)
+
+    def start(self):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class SoundDeviceSource(AudioSource):
+    """
+    Live input through a sounddevice InputStream callback.
+
+    Args:
+        device: sounddevice input device (index or name), None for the default.
+    """
+
+    def __init__(self, device=None, samplerate=SAMPLE_RATE, blocksize=BLOCK_SIZE, seconds=2.0, gain=GAIN):
+        super().__init__(samplerate, blocksize, seconds, gain)
+        self.device = device
+        self.status = None  # Last non-empty callback status (e.g. input overflow)
+        self._stream = None
+
+    def _callback(self, indata, frames, time_info, status):
+        if status:
+            self.status = status
+        self.process(indata[:, 0] if indata.shape[1] == 1 else indata.mean(axis=1, dtype=np.float32))
+
+    def start(self):
+        import sounddevice as sd  # Only needed for live input
+        self._stream = sd.InputStream(device=self.device, channels=1, samplerate=self.samplerate,
+                                      blocksize=self.blocksize, dtype="float32", callback=self._callback)
+        self._stream.start()
+
+    def stop(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+
+class _ThreadedSource(AudioSource):
+    """Feeds blocks from next_block() on a background thread, paced to real time against absolute deadlines."""
+
+    def __init__(self, samplerate=SAMPLE_RATE, blocksize=BLOCK_SIZE, seconds=2.0, realtime=True, gain=GAIN):
+        super().__init__(samplerate, blocksize, seconds, gain)
+        self.realtime = realtime
+        self.finished = threading.Event()  # Set when a non-looping source runs out
+        self._stop = threading.Event()
+        self._thread = None
+
+    def next_block(self):
+        """Returns the next mono float32 block, or None at the end."""
+        raise NotImplementedError
+
+    def _run(self):
+        period = self.blocksize / self.samplerate
+        start = time.monotonic()
+        n = 0
+        while not self._stop.is_set():
+            block = self.next_block()
+            if block is None:
+                self.finished.set()
+                return
+            self.process(block)
+            n += 1
+            if self.realtime:
+                delay = start + n * period - time.monotonic()
+                if delay > 0:
+                    self._stop.wait(delay)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+
+def read_wav(path):
+    """
+    Reads a PCM WAV file.
+
+    Returns:
+        tuple: (mono float32 samples in -1..1, sample rate in Hz).
+    """
+    with wave.open(path, "rb") as wav:
+        channels, width, samplerate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        data = wav.readframes(wav.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768
+    elif width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        ints = (raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) | (raw[:, 2].astype(np.int32) << 16))
+        samples = ((ints << 8) >> 8).astype(np.float32) / 8388608  # Sign-extend 24 bits
+    elif width == 4:
+        samples = np.frombuffer(data, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width} bytes")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples.astype(np.float32), samplerate
+
+
+class WavSource(_ThreadedSource):
+    """
+    Plays a WAV file into the analysis at real-time speed (without sound output).
+
+    Args:
+        path (str): PCM WAV file, mixed down to mono.
+        loop (bool): Start over at the end instead of finishing.
+    """
+
+    def __init__(self, path, blocksize=BLOCK_SIZE, seconds=2.0, loop=True, realtime=True, gain=GAIN):
+        self.samples, samplerate = read_wav(path)
+        super().__init__(samplerate, blocksize, seconds, realtime, gain)
+        self.loop = loop
+        self.position = 0
+
+    def next_block(self):
+        if self.position >= len(self.samples):
+            if not self.loop or len(self.samples) == 0:
+                return None
+            self.position = 0
+        block = self.samples[self.position:self.position + self.blocksize]
+        self.position += self.blocksize
+        return block
+
+
+class SyntheticSource(_ThreadedSource):
+    """
+    Deterministic test signal: a kick drum on every beat, a hi-hat on the off-beats and a
+    bass line that rises every bar, so levels, bands and onsets all have something to show.
+
+    Args:
+        bpm (float): Tempo in beats per minute.
+        seed (int): Seed of the hi-hat noise.
+    """
+
+    def __init__(self, samplerate=SAMPLE_RATE, blocksize=BLOCK_SIZE, seconds=2.0, bpm=120, seed=0, realtime=True,
+                 gain=GAIN):
+        super().__init__(samplerate, blocksize, seconds, realtime, gain)
+        self.bpm = bpm
+        self.position = 0
+        self._noise = np.random.default_rng(seed).uniform(-1, 1, samplerate).astype(np.float32)
+
+    def next_block(self):
+        t = (self.position + np.arange(self.blocksize)) / self.samplerate
+        beat = 60.0 / self.bpm
+        in_beat = t % beat
+        kick = np.sin(2 * np.pi * 55 * in_beat) * np.exp(-in_beat * 18)
+        in_offbeat = (t + beat / 2) % beat
+        noise = self._noise[(self.position + np.arange(self.blocksize)) % len(self._noise)]
+        hat = noise * np.exp(-in_offbeat * 60) * 0.3
+        bar = (t // (beat * 4)) % 4
+        bass = np.sin(2 * np.pi * 110 * (1 + bar / 4) * t) * 0.2
+        self.position += self.blocksize
+        return (0.6 * kick + hat + bass).astype(np.float32)
+
+
+def open_audio_source(spec="device", device=None, samplerate=SAMPLE_RATE, blocksize=BLOCK_SIZE, gain=GAIN):
+    """
+    Creates an audio source from a command-line style spec.
+
+    Args:
+        spec (str): "device" for live input, "synth" for the test signal, or a path to a .wav file.
+        device: Input device for "device".
+        gain (float): Level scale, level = RMS * gain clipped to 1.
+    """
+    if spec == "device":
+        return SoundDeviceSource(device, samplerate, blocksize, gain=gain)
+    if spec == "synth":
+        return SyntheticSource(samplerate, blocksize, gain=gain)
+    return WavSource(spec, blocksize, gain=gain)
+
+
+BANDS = (("bass", 20, 250), ("mid", 250, 4000), ("treble", 4000, 16000))
+
+
+class AudioAnalyzer:
+    """
+    Windowed rFFT band energies, onset detection and smoothed envelopes, one call per audio block.
+
+    Everything per block is a handful of vectorized NumPy calls on a precomputed window and
+    band matrix (about 50 µs for 2048 samples), so it runs on the audio thread without holding
+    anything up. Results are published by replacing whole attributes, readers just take the
+    latest value.
+
+    Args:
+        samplerate (int): Sample rate in Hz.
+        size (int): FFT size. Longer blocks use their newest `size` samples, shorter ones are zero-padded.
+        bands (tuple): (name, low Hz, high Hz) per band.
+        attack (float): Envelope rise time constant in seconds.
+        release (float): Envelope fall time constant in seconds.
+        onset_ratio (float): Spectral flux above this multiple of its running mean counts as an onset.
+        refractory (float): Minimum seconds between onsets.
+
+    Attributes:
+        energies (np.ndarray): Raw band magnitudes of the latest block.
+        envelopes (np.ndarray): Smoothed band levels, normalized to 0..1 against a slowly decaying peak.
+        onsets (int): Onsets detected so far. Readers compare it to the last count they saw,
+            so no onset is lost between two frames.
+        seconds (float): Audio time analyzed so far.
+        elapsed (float): Time spent in the latest process() call, in seconds.
+    """
+
+    def __init__(self, samplerate=SAMPLE_RATE, size=FFT_SIZE, bands=BANDS,
+                 attack=0.01, release=0.25, onset_ratio=1.8, refractory=0.1):
+        self.samplerate = samplerate
+        self.size = size
+        self.names = tuple(name for name, _, _ in bands)
+        self.attack = attack
+        self.release = release
+        self.onset_ratio = onset_ratio
+        self.refractory = refractory
+        self.window = np.hanning(size).astype(np.float32)
+        freqs = np.fft.rfftfreq(size, 1.0 / samplerate)
+        # Bins x bands matrix, so all band energies are one matmul
+        self.band_matrix = np.stack([(freqs >= low) & (freqs < high) for _, low, high in bands], axis=1)
+        self.band_matrix = self.band_matrix.astype(np.float32)
+        self.energies = np.zeros(len(bands), dtype=np.float32)
+        self.envelopes = np.zeros(len(bands), dtype=np.float32)
+        self.onsets = 0
+        self.seconds = 0.0
+        self.elapsed = 0.0
+        self._smoothed = np.zeros(len(bands), dtype=np.float32)
+        self._peaks = np.full(len(bands), 1e-6, dtype=np.float32)
+        self._previous = np.zeros(len(freqs), dtype=np.float32)
+        self._flux_mean = 0.0
+        self._last_onset = -1.0
+
+    def band(self, name):
+        """Latest envelope of a band by name."""
+        return float(self.envelopes[self.names.index(name)])
+
+    def attach(self, source):
+        """Analyzes every block of an AudioSource on its audio thread, over the newest `size` samples of its ring."""
+        source.on_block.append(lambda block: self.process(source.ring.latest(self.size), len(block)))
+
+    def process(self, block, hop=None):
+        """
+        Analyzes one block.
+
+        Args:
+            block (np.ndarray): Mono float32 samples.
+            hop (int): Samples advanced since the previous call, defaults to len(block). Offline
+                analysis passes overlapping windows with the hop of one video frame.
+        """
+        start = time.perf_counter()
+        hop = len(block) if hop is None else hop
+        frame = np.zeros(self.size, dtype=np.float32)
+        block = block[-self.size:]
+        frame[self.size - len(block):] = block
+        magnitudes = np.abs(np.fft.rfft(frame * self.window)).astype(np.float32) / self.size
+        energies = magnitudes @ self.band_matrix
+
+        # Attack/release smoothing, coefficients follow the hop so the time constants hold at any rate
+        dt = hop / self.samplerate
+        rising = energies > self._smoothed
+        coefficients = np.where(rising, np.exp(-dt / self.attack), np.exp(-dt / self.release)).astype(np.float32)
+        self._smoothed = energies + (self._smoothed - energies) * coefficients
+        # Auto gain with about 10 s of memory
+        self._peaks = np.maximum(self._smoothed, self._peaks * np.float32(np.exp(-dt / 10.0)))
+
+        # Onsets: positive spectral flux against its running mean
+        flux = float(np.maximum(magnitudes - self._previous, 0).sum())
+        self._previous = magnitudes
+        self.seconds += dt
+        if (flux > self._flux_mean * self.onset_ratio and flux > 1e-4
+                and self.seconds - self._last_onset >= self.refractory):
+            self._last_onset = self.seconds
+            self.onsets += 1
+        self._flux_mean += (flux - self._flux_mean) * min(1.0, dt / 0.5)
+
+        self.energies = energies
+        self.envelopes = np.minimum(self._smoothed / np.maximum(self._peaks, 1e-6), 1.0)
+        self.elapsed = time.perf_counter() - start
+
+
+def analyze_frames(samples, samplerate, fps, analyzer, gain=GAIN):
+    """
+    Runs the analysis offline at exactly the video frame rate.
+
+    Frame n covers the samples up to round((n + 1) * samplerate / fps), so frame and audio
+    times never drift apart, and the same input always gives the same values.
+
+    Args:
+        samples (np.ndarray): Mono float32 samples (e.g. from read_wav).
+        samplerate (int): Sample rate in Hz.
+        fps (float): Video frame rate.
+        analyzer (AudioAnalyzer): Receives the analysis window of every frame.
+        gain (float): Level scale, as in AudioSource.
+
+    Yields:
+        float: Level of each frame (0..1), the analyzer holds the envelopes and onsets.
+    """
+    frames = math.ceil(len(samples) * fps / samplerate)
+    previous = 0
+    for frame in range(frames):
+        end = min(round((frame + 1) * samplerate / fps), len(samples))
+        hop = samples[previous:end]
+        analyzer.process(samples[max(0, end - analyzer.size):end], end - previous)
+        rms = float(np.sqrt(np.dot(hop, hop) / len(hop))) if len(hop) else 0.0
+        previous = end
+        yield min(rms * gain, 1.0)
+
+
+AUDIO_SOURCES = tuple(name for name, _, _ in BANDS) + ("level", "onset")
+MAPPED_PARAMS = ("freq_r", "freq_a", "phase_r", "phase_a", "palette")
+DEFAULT_AMOUNTS = {"freq_r": 0.5, "freq_a": 1.0, "phase_r": math.pi / 2, "phase_a": math.pi / 2, "palette": 1}
+DEFAULT_MAP = ("bass:freq_r", "treble:phase_a", "onset:palette")
+
+
+def parse_audio_map(specs):
+    """
+    Parses SOURCE:PARAM[:AMOUNT] mapping entries (the --map option).
+
+    Returns:
+        list: (source, param, amount) tuples.
+    """
+    mapping = []
+    for spec in specs:
+        parts = spec.split(":")
+        if len(parts) not in (2, 3) or parts[0] not in AUDIO_SOURCES or parts[1] not in MAPPED_PARAMS:
+            raise ValueError(f"Bad --map entry {spec!r}, expected SOURCE:PARAM[:AMOUNT] with SOURCE in "
+                             f"{'/'.join(AUDIO_SOURCES)} and PARAM in {'/'.join(MAPPED_PARAMS)}")
+        source, param = parts[0], parts[1]
+        if param == "palette" and source != "onset":
+            raise ValueError(f"Bad --map entry {spec!r}, palette can only be stepped by onsets")
+        amount = float(parts[2]) if len(parts) == 3 else DEFAULT_AMOUNTS[param]
+        mapping.append((source, param, amount))
+    return mapping
+
+
+class AudioModulation:
+    """
+    Applies an audio mapping to mandala parameters once per frame.
+
+    Bands and the level modulate around the current value: the offset added last frame is
+    swapped for the new one, so keyboard changes and animation keep working underneath.
+    Onsets step the parameter (or palette) by the amount for every onset since the last frame.
+
+    Args:
+        mapping (list): (source, param, amount) tuples from parse_audio_map.
+        analyzer (AudioAnalyzer): Source of the band envelopes and onsets.
+    """
+
+    def __init__(self, mapping, analyzer):
+        self.mapping = mapping
+        self.analyzer = analyzer
+        self.offsets = {}  # param -> offset currently added by the bands
+        self.onsets_seen = 0
+
+    def apply(self, params, level=0.0):
+        """Updates params (MandalaParams-like, with palettes and palette_index) for one frame."""
+        envelopes = self.analyzer.envelopes  # One read, the audio thread replaces the array as a whole
+        onsets = self.analyzer.onsets
+        new_onsets = onsets - self.onsets_seen
+        self.onsets_seen = onsets
+        offsets = {}
+        for source, param, amount in self.mapping:
+            if source == "onset":
+                if not new_onsets:
+                    continue
+                if param == "palette":
+                    params.palette_index = (params.palette_index + int(amount) * new_onsets) % len(params.palettes)
+                else:
+                    setattr(params, param, getattr(params, param) + amount * new_onsets)
+                continue
+            value = level if source == "level" else float(envelopes[self.analyzer.names.index(source)])
+            offsets[param] = offsets.get(param, 0.0) + value * amount
+        for param in set(offsets) | set(self.offsets):
+            change = offsets.get(param, 0.0) - self.offsets.get(param, 0.0)
+            setattr(params, param, getattr(params, param) + change)
+        self.offsets = offsets
+
+    def status(self):
+        bars = " ".join(f"{name}={self.analyzer.band(name):.2f}" for name in self.analyzer.names)
+        return f"{bars} onsets={self.analyzer.onsets} ({self.analyzer.elapsed * 1000:.2f} ms/block)"
@@ -0,0 +1,333 @@
+"""
+Benchmark for the mandala pipeline: generate → diff/write → capture → export.
+
+Runs seeded, reproducible workloads (the same parameter trajectory on
+every run) over several canvas sizes and times each stage separately:
+
+    generate   ascii_mandala.generate_frame
+    render     AnsiEmitter.encode + write, as in the main loop, into a null sink (/dev/null)
+    capture    ascii_mandala.capture_frame while streaming to a GIF (--stream gif),
+               so every frame is rendered through the glyph atlas as in a live capture
+    gif        ascii_mandala.export_gif of a filled capture buffer
+    png        ascii_mandala.save_frame_as_png_sequence of a filled capture buffer
+
+Each stage reports frames/sec, bytes emitted (ANSI bytes or file size) and
+peak traced memory (tracemalloc, measured in a separate pass so it does not
+skew the timings). Results are saved as JSON, and --compare checks a run
+against an earlier JSON file and exits with status 1 on regressions.
+
+--verify checks that the vectorized MandalaEngine still matches the original
+per-cell scalar code cell for cell (palette indices and RGB colors) over
+random parameters, offsets, levels of detail and brightness, and exits with
+status 1 on any mismatch. The engine relies on exact float ordering, so run
+it after every engine change.
+
+Usage:
+    python mandala_bench.py
+    python mandala_bench.py --verify --cases 500
+    python mandala_bench.py --sizes 80x24 120x40 --frames 200 --output bench.json
+    python mandala_bench.py --output new.json --compare bench.json --tolerance 0.15
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import ascii_mandala as am
+from mandala_ansi import COLOR_MODES, AnsiEmitter
+from mandala_engine import MandalaEngine
+from mandala_render import trajectory
+
+DEFAULT_SIZES = ["80x24", "120x40", "360x92", "1000x300"]
+STAGES = ["generate", "render", "capture", "gif", "png"]
+
+
+def parse_size(text):
+    width, _, height = text.lower().partition("x")
+    try:
+        return int(width), int(height)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"size must look like 120x40, not {text!r}")
+
+
+def workload(width, height, frames, seed):
+    """
+    Sets ascii_mandala up for a canvas size and returns a seeded parameter trajectory.
+
+    phase_a and freq_r move every frame, so the engine's term caches miss like in a live animation.
+    """
+    am.configure(am.parser.parse_args([str(width), str(height), "--stream", "gif"]))
+    random.seed(seed)
+    params = am.MandalaParams(palette_index=seed % 8)
+    palette = params.palettes[params.palette_index]
+    records = list(trajectory(params, {"phase_a": 1, "freq_r": -1}, 0.02, frames, params.palette_index))
+    return params, palette, records
+
+
+_mark = {}
+
+
+def begin():
+    """Marks the start of the measured part of a stage, after its input has been prepared."""
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+        _mark["memory"] = tracemalloc.get_traced_memory()[0]
+    _mark["time"] = time.perf_counter()
+
+
+def measure(run, memory):
+    """
+    Runs a stage once.
+
+    Returns:
+        tuple: (seconds, bytes emitted, peak memory above the stage's starting point or None).
+    """
+    if memory:
+        tracemalloc.start()
+    _mark.update(time=time.perf_counter(), memory=0)
+    emitted = run()
+    elapsed = time.perf_counter() - _mark["time"]
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1] - _mark["memory"]
+        tracemalloc.stop()
+    return elapsed, emitted, peak
+
+
+def stage_runs(width, height, frames, export_frames, seed, font_path, workdir, color_mode="truecolor"):
+    """Returns {stage: (frame count, callable returning emitted bytes)} for one canvas size."""
+    params, palette, records = workload(width, height, frames, seed)
+    # (chars, hue) grids of the captured frames, prepared outside the timed part of each stage
+    grids = [(am.generate_frame(record, record.frame_count, palette)[0], am.engine.hues(record, record.frame_count))
+             for record in records[:export_frames]]
+    from mandala_capture import get_atlas
+    get_atlas(font_path, palette)  # Glyph rasterization is a one-off per font, keep it out of every stage
+
+    def generate():
+        am.engine.hue_cache.clear()
+        for record in records:
+            am.generate_frame(record, record.frame_count, palette)
+        return 0
+
+    def render():
+        frames_out = [(*am.generate_frame(record, record.frame_count, palette),
+                       am.engine.hues(record, record.frame_count)) for record in records]
+        with open(os.devnull, "w", encoding="utf-8") as sink:
+            emitter = AnsiEmitter(width, height, stream=sink, color_mode=color_mode)
+            begin()  # Generation is not part of this stage
+            for chars, colors, hue in frames_out:
+                emitter.write(emitter.encode(chars, colors, hue))
+        return emitter.total_bytes
+
+    def capture():
+        from mandala_capture import open_stream_writer
+        filename = os.path.join(workdir, "capture.gif")
+        am.stream_writer[0] = open_stream_writer("gif", am.FPS, filename)
+        begin()
+        try:
+            for chars, hue in grids:
+                am.capture_frame(chars, hue, font_path, palette)
+        finally:
+            am.close_stream()
+        return os.path.getsize(filename)
+
+    def gif():
+        filename = os.path.join(workdir, "bench.gif")
+        am.frames[:] = grids  # export_gif empties the buffer, refill it for every run
+        begin()
+        am.export_gif(font_path, params.palettes, filename)
+        return os.path.getsize(filename)
+
+    def png():
+        output_dir = os.path.join(workdir, "png")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        am.frames[:] = grids
+        begin()
+        am.save_frame_as_png_sequence(font_path, params.palettes, output_dir)
+        return sum(os.path.getsize(os.path.join(output_dir, f)) for f in os.listdir(output_dir))
+
+    return {
+        "generate": (len(records), generate),
+        "render": (len(records), render),
+        "capture": (min(export_frames, len(records)), capture),
+        "gif": (min(export_frames, len(records)), gif),
+        "png": (min(export_frames, len(records)), png),
+    }
+
+
+def run_size(width, height, args, font_path, workdir):
+    results = {}
+    runs = stage_runs(width, height, args.frames, args.export_frames, args.seed, font_path, workdir, args.colors)
+    for stage in args.stages:
+        count, run = runs[stage]
+        elapsed, emitted, _ = measure(run, memory=False)
+        _, _, peak = measure(run, memory=True)
+        results[stage] = {
+            "frames": count,
+            "seconds": round(elapsed, 6),
+            "fps": round(count / elapsed, 2) if elapsed else None,
+            "bytes": emitted,
+            "bytes_per_frame": emitted // count if count else 0,
+            "peak_memory": peak,
+        }
+        print(f"  {stage:<9} {results[stage]['fps']:>9} fps  {emitted:>11} B  peak {peak / 2**20:8.1f} MiB", flush=True)
+    am.frames.clear()
+    return results
+
+
+def reference_frame(params, frame_count, width, height, palette_len, brightness=1.0, step=1, color_interval=1):
+    """
+    The original per-cell generate_frame, returning (palette indices, RGB colors, values) as nested lists.
+
+    values holds each cell's sin(r*freq_r+phase_r) + cos(angle*freq_a+phase_a) before it is mapped to
+    the palette, so float differences show up even when they do not flip an index.
+
+    step and color_interval follow MandalaEngine.set_lod: each cell takes the values of the top-left
+    cell of its step x step block, and the hue shift is held for color_interval frames.
+    """
+    center_x = width // 2
+    center_y = height // 2
+    hue_shift = (frame_count - frame_count % color_interval) * 2
+    frame = [[0] * width for _ in range(height)]
+    color = [[(0, 0, 0)] * width for _ in range(height)]
+    values = [[0.0] * width for _ in range(height)]
+    for y in range(height):
+        for x in range(width):
+            dx = x - x % step - center_x + params.offset_x
+            dy = y - y % step - center_y + params.offset_y
+            r = math.sqrt(dx*dx + dy*dy)
+            angle = math.atan2(dy, dx)
+            val = math.sin(r * params.freq_r + params.phase_r) + math.cos(angle * params.freq_a + params.phase_a)
+            values[y][x] = val
+            index = int((val + 2) / 4 * palette_len)
+            frame[y][x] = index % palette_len
+
+            hue = int((r / (width / 2)) * 255 + hue_shift) % 256
+            red = int((math.sin(hue * 0.03) + 1) * 127 * brightness)
+            green = int((math.sin(hue * 0.05 + 2) + 1) * 127 * brightness)
+            blue = int((math.sin(hue * 0.07 + 4) + 1) * 127 * brightness)
+            color[y][x] = (red, green, blue)
+    return frame, color, values
+
+
+def verify(cases, seed, sizes=((80, 24), (37, 13), (120, 40))):
+    """
+    Compares MandalaEngine.generate with reference_frame over random cases.
+
+    Each case changes one to all parameters of the previous one, so the engine's term, index and
+    hue caches are hit and missed as in an animation. Some values are round (zero or integer
+    frequencies, phases at multiples of pi/2), which puts many cells exactly on palette boundaries.
+    Returns the number of mismatching cases.
+    """
+    rng = random.Random(seed)
+    engines = {size: MandalaEngine(*size) for size in sizes}
+    params = am.MandalaParams()
+    failures = 0
+    for case in range(cases):
+        width, height = rng.choice(sizes)
+        engine = engines[width, height]
+        for name in rng.sample(["freq_r", "freq_a", "phase_r", "phase_a", "offset"], rng.randint(1, 5)):
+            if name == "offset":
+                params.offset_x, params.offset_y = rng.randint(-width, width), rng.randint(-height, height)
+            elif name.startswith("freq"):
+                setattr(params, name, rng.choice([rng.uniform(-3.0, 8.0), float(rng.randint(-2, 6))]))
+            else:
+                setattr(params, name, rng.choice([rng.uniform(-20.0, 20.0), rng.randint(-4, 4) * math.pi / 2]))
+        frame_count = rng.randint(0, 100000)
+        palette_len = rng.choice([10, 10, 10, 3, 7, 16])
+        brightness = rng.choice([1.0, rng.uniform(0.5, 1.0)])
+        step, color_interval = rng.choice([(1, 1), (1, 2), (2, 2), (3, 3)])
+        engine.set_lod(step, color_interval)
+        index, color = engine.generate(params, frame_count, palette_len, brightness)
+        values = engine.geometry(params).upsample(engine.radial_term(params)[1] + engine.angular_term(params)[1])
+        expected_index, expected_color, expected_values = reference_frame(
+            params, frame_count, width, height, palette_len, brightness, step, color_interval)
+        wrong_value = int((values != expected_values).sum())
+        wrong_index = int((index != expected_index).sum())
+        wrong_color = int((color != expected_color).any(axis=2).sum())
+        if wrong_value or wrong_index or wrong_color:
+            failures += 1
+            print(f"❌ case {case} {width}x{height} step={step}/{color_interval} brightness={brightness!r} "
+                  f"frame={frame_count} freq_r={params.freq_r!r} freq_a={params.freq_a!r} "
+                  f"phase_r={params.phase_r!r} phase_a={params.phase_a!r} offset={params.offset_x},{params.offset_y}: "
+                  f"{wrong_value} values, {wrong_index} indices, {wrong_color} colors differ")
+    print(f"{'✅' if not failures else '❌'} {cases - failures}/{cases} cases identical to the scalar reference")
+    return failures
+
+
+def compare(current, baseline, tolerance):
+    """Prints fps changes against a baseline run, returns the list of regressed size/stage pairs."""
+    regressions = []
+    for size, stages in current["results"].items():
+        for stage, result in stages.items():
+            old = baseline.get("results", {}).get(size, {}).get(stage)
+            if not old or not old.get("fps") or not result["fps"]:
+                continue
+            ratio = result["fps"] / old["fps"]
+            marker = "❌" if ratio < 1 - tolerance else "✅"
+            print(f"{marker} {size:>9} {stage:<9} {old['fps']:>9} → {result['fps']:>9} fps ({ratio - 1:+.1%})")
+            if ratio < 1 - tolerance:
+                regressions.append((size, stage))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the mandala pipeline stages")
+    parser.add_argument("--sizes", type=parse_size, nargs="+", default=[parse_size(s) for s in DEFAULT_SIZES],
+                        metavar="WxH", help=f"Canvas sizes (default: {' '.join(DEFAULT_SIZES)})")
+    parser.add_argument("--frames", type=int, default=100, help="Frames for the generate and render stages")
+    parser.add_argument("--export-frames", type=int, default=5, help="Frames for the capture and export stages")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="Stages to run")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the parameter trajectory")
+    parser.add_argument("--colors", choices=COLOR_MODES, default="truecolor",
+                        help="Terminal color mode of the render stage")
+    parser.add_argument("--font", default=am.DEFAULT_FONT, help="Font used by the capture and export stages")
+    parser.add_argument("--output", default="mandala_bench.json", help="JSON results file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Earlier JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Allowed fps drop before a stage counts as regressed")
+    parser.add_argument("--verify", action="store_true",
+                        help="Check the engine against the scalar reference instead of benchmarking")
+    parser.add_argument("--cases", type=int, default=200, help="Random cases for --verify")
+    args = parser.parse_args(argv)
+    if args.verify:
+        return 1 if verify(args.cases, args.seed) else 0
+    args.stages = [stage for stage in STAGES if stage in args.stages]
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "colors": args.colors,
+        "frames": args.frames,
+        "export_frames": args.export_frames,
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="mandala_bench_") as workdir:
+        for width, height in args.sizes:
+            print(f"📐 {width}x{height}", flush=True)
+            report["results"][f"{width}x{height}"] = run_size(width, height, args, args.font, workdir)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 Results: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,424 @@
+"""
+Frame capture helpers for the ASCII mandala.
+
+Rasterizes frames to images through a glyph atlas: every glyph is drawn
+once per font and size as an alpha mask, and whole frames are composited
+by tinting and tiling those masks with NumPy instead of calling
+draw.text for every cell. Glyphs wider or taller than a cell overlap
+their neighbours just as they do with draw.text.
+
+Recordings can also be streamed to disk frame by frame (GIF, or MP4
+through a piped ffmpeg process) instead of being kept in memory.
+
+Long "last N seconds" recordings go to a memory-mapped ring of raw
+char-index and hue-index grids (FrameRing) that never grows.
+
+GIF frames are written as indexed images against one global palette
+built from the engine's hue table, so no per-frame quantization is
+needed and colors stay stable between frames.
+"""
+
+import shutil
+import subprocess
+import time
+
+import numpy as np
+from PIL import GifImagePlugin, Image, ImageDraw, ImageFont
+
+from mandala_engine import HUE_RGB
+
+CELL_SIZE = (10, 18)  # Character cell width and height in pixels
+FONT_SIZE = 14
+
+
+def _build_gif_palette():
+    # Index 0 is the black background, the rest are the distinct hue colors (254 of them)
+    colors, hue_index = np.unique(HUE_RGB, axis=0, return_inverse=True)
+    palette = np.vstack([np.zeros((1, 3), dtype=np.uint8), colors])
+    return palette, (hue_index.reshape(-1) + 1).astype(np.uint8)
+
+
+# Global GIF palette (RGB rows) and the palette index of each hue step
+GIF_PALETTE, HUE_TO_GIF_INDEX = _build_gif_palette()
+
+
+def load_font(font_path, font_size=FONT_SIZE):
+    try:
+        return ImageFont.truetype(font_path, font_size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+class GlyphAtlas:
+    """
+    Alpha masks of glyphs rendered with one font, size and cell size.
+
+    Args:
+        font_path (str): Path to a TrueType/OpenType font.
+        glyphs (iterable[str]): Initial glyphs to rasterize, more are added on demand.
+        font_size (int): Font size in points.
+        cell_size (tuple[int, int]): Cell width and height in pixels.
+
+    Glyphs are drawn at the top-left of their cell like draw.text does, on a canvas that
+    reaches as many whole cells past each side as the widest glyph needs, so wide glyphs
+    (⬤, ╳, shades) are not cut off. The part inside the cell and each overhang into a
+    neighbouring cell are kept as separate layers; frames composite the overhangs in cell
+    order, so later cells are drawn over earlier ones as with per-cell draw.text.
+    """
+
+    def __init__(self, font_path, glyphs=(), font_size=FONT_SIZE, cell_size=CELL_SIZE):
+        self.font_path = font_path
+        self.font_size = font_size
+        self.cell_size = cell_size
+        self.font = load_font(font_path, font_size)
+        self.codepoints = np.zeros(0, dtype=np.uint32)  # Sorted, parallel to the masks of every layer
+        self.reach = (0, 0, 0, 0)  # Cells the glyphs reach past their own cell: up, down, left, right
+        self._rebuild([])
+        self.add(glyphs)
+
+    def _reach(self, codepoints):
+        cell_w, cell_h = self.cell_size
+        up, down, left, right = self.reach
+        for cp in codepoints:
+            x0, y0, x1, y1 = self.font.getbbox(chr(cp))
+            up = max(up, -(y0 // cell_h))
+            down = max(down, -(-y1 // cell_h) - 1)
+            left = max(left, -(x0 // cell_w))
+            right = max(right, -(-x1 // cell_w) - 1)
+        return up, down, left, right
+
+    def _rasterize(self, ch):
+        cell_w, cell_h = self.cell_size
+        up, down, left, right = self.reach
+        mask = Image.new("L", ((left + 1 + right) * cell_w, (up + 1 + down) * cell_h), 0)
+        ImageDraw.Draw(mask).text((left * cell_w, up * cell_h), ch, fill=255, font=self.font)
+        return np.asarray(mask, dtype=np.uint8)
+
+    def _rebuild(self, codepoints):
+        cell_w, cell_h = self.cell_size
+        up, down, left, right = self.reach
+        self.codepoints = np.array(codepoints, dtype=np.uint32)
+        canvas = np.stack([self._rasterize(chr(cp)) for cp in codepoints]) if codepoints else \
+            np.zeros((0, (up + 1 + down) * cell_h, (left + 1 + right) * cell_w), dtype=np.uint8)
+        # (dy, dx) offset of the cell a layer lands in -> (masks, window in that cell), in drawing
+        # order: a source cell further up and left is drawn first, so layers from below-right come
+        # first. Overhangs are cropped to the rows and columns any glyph reaches.
+        self.layers = {}
+        self.overhangs = {}  # Glyphs with pixels in each overhang layer, frames only touch those cells
+        for dy in range(down, -up - 1, -1):
+            for dx in range(right, -left - 1, -1):
+                y, x = (up + dy) * cell_h, (left + dx) * cell_w
+                masks = canvas[:, y:y + cell_h, x:x + cell_w]
+                if (dy, dx) == (0, 0):
+                    self.masks = np.ascontiguousarray(masks)
+                    self.layers[dy, dx] = (self.masks, (slice(None), slice(None)))
+                    continue
+                lit = masks.any(axis=0)
+                if not lit.any():
+                    continue
+                rows, cols = np.nonzero(lit.any(axis=1))[0], np.nonzero(lit.any(axis=0))[0]
+                window = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+                self.layers[dy, dx] = (np.ascontiguousarray(masks[(slice(None),) + window]), window)
+                self.overhangs[dy, dx] = masks.reshape(len(masks), -1).any(axis=1)
+
+    def add(self, glyphs):
+        """Rasterizes glyphs that are not in the atlas yet."""
+        new = sorted({ord(ch) for ch in glyphs} - set(self.codepoints.tolist()))
+        if not new:
+            return
+        self.reach = self._reach(new)
+        self._rebuild(sorted(self.codepoints.tolist() + new))
+
+    def slots(self, chars):
+        """Maps an HxW array of single characters to atlas slots, rasterizing unseen glyphs."""
+        codepoints = np.ascontiguousarray(chars, dtype="<U1").view(np.uint32)
+        slots = np.searchsorted(self.codepoints, codepoints).clip(0, max(len(self.codepoints) - 1, 0))
+        if len(self.codepoints) == 0 or not (self.codepoints[slots] == codepoints).all():
+            self.add(chr(cp) for cp in np.unique(codepoints).tolist())
+            return self.slots(chars)
+        return slots
+
+    def _composite(self, slots, tiles, draw):
+        """
+        Draws every layer into HxW tiles in cell order.
+
+        draw(masks, source, target, fill=False) draws the masks of the source cells into the
+        tiles[target] windows, over what is there or, with fill, onto black. The in-cell layer
+        is filled in one dense pass; only cells that an earlier overhang reached are drawn
+        again over what was below them.
+        """
+        height, width = slots.shape
+        touched = np.zeros(slots.shape, dtype=bool)
+        for (dy, dx), (masks, window) in self.layers.items():
+            if (dy, dx) == (0, 0):
+                ys, xs = np.nonzero(touched)
+                below = tiles[ys, xs]
+                everything = (slice(None), slice(None))
+                draw(masks[slots], everything, everything, fill=True)
+                tiles[ys, xs] = below
+                draw(masks[slots[ys, xs]], (ys, xs), (ys, xs))
+                continue
+            ys, xs = np.nonzero(self.overhangs[dy, dx][slots])
+            ty, tx = ys + dy, xs + dx
+            inside = (ty >= 0) & (ty < height) & (tx >= 0) & (tx < width)  # Overhangs past the image edge are clipped
+            if inside.any():
+                ys, xs, ty, tx = ys[inside], xs[inside], ty[inside], tx[inside]
+                draw(masks[slots[ys, xs]], (ys, xs), (ty, tx) + window)
+                touched[ty, tx] = True
+
+    def render(self, chars, colors):
+        """
+        Composites a frame into an RGB image.
+
+        Args:
+            chars (np.ndarray): HxW array of characters.
+            colors (np.ndarray): HxWx3 uint8 RGB array.
+
+        Returns:
+            PIL.Image.Image: RGB image of (W * cell width) x (H * cell height) pixels on black.
+        """
+        height, width = chars.shape
+        cell_w, cell_h = self.cell_size
+        slots = self.slots(chars)  # May grow the atlas, so look up masks afterwards
+        tiles = np.zeros((height, width, cell_h, cell_w, 3), dtype=np.uint16)
+
+        def over(masks, source, target, fill=False):
+            # Same blend as draw.text: glyph color over what is already there, by coverage
+            masks = masks.astype(np.uint16)[..., None]
+            tinted = masks * colors[source][..., None, None, :]
+            if fill:
+                tiles[target] = (tinted + 127) // 255
+            else:
+                tiles[target] = (tiles[target] * (255 - masks) + tinted + 127) // 255
+
+        self._composite(slots, tiles, over)
+        pixels = tiles.astype(np.uint8).transpose(0, 2, 1, 3, 4).reshape(height * cell_h, width * cell_w, 3)
+        return Image.fromarray(pixels, "RGB")
+
+    def render_indexed(self, chars, hue):
+        """
+        Composites a frame into a paletted image that uses GIF_PALETTE.
+
+        Args:
+            chars (np.ndarray): HxW array of characters.
+            hue (np.ndarray): HxW grid of hue steps (0..255).
+
+        Returns:
+            PIL.Image.Image: "P" mode image, glyph pixels at least half covered take the cell's hue color.
+        """
+        height, width = chars.shape
+        cell_w, cell_h = self.cell_size
+        slots = self.slots(chars)
+        index = HUE_TO_GIF_INDEX[hue]
+        tiles = np.zeros((height, width, cell_h, cell_w), dtype=np.uint8)
+
+        def cover(masks, source, target, fill=False):
+            tiles[target] = np.where(masks >= 128, index[source][..., None, None], 0 if fill else tiles[target])
+
+        self._composite(slots, tiles, cover)
+        pixels = tiles.transpose(0, 2, 1, 3).reshape(height * cell_h, width * cell_w)
+        image = Image.fromarray(pixels, "P")
+        image.putpalette(GIF_PALETTE.tobytes())
+        return image
+
+
+_atlases = {}
+
+
+def get_atlas(font_path, glyphs=(), font_size=FONT_SIZE, cell_size=CELL_SIZE):
+    """Returns the shared atlas for a font, size and cell size, so every capture path reuses it."""
+    key = (font_path, font_size, cell_size)
+    atlas = _atlases.get(key)
+    if atlas is None:
+        atlas = _atlases[key] = GlyphAtlas(font_path, glyphs, font_size, cell_size)
+    else:
+        atlas.add(glyphs)
+    return atlas
+
+
+def render_image(chars, colors, font_path, glyphs=()):
+    """Renders a char/color frame to a PIL image with the shared glyph atlas."""
+    return get_atlas(font_path, glyphs).render(chars, colors)
+
+
+def render_indexed_image(chars, hue, font_path, glyphs=()):
+    """Renders a char/hue frame to a GIF_PALETTE indexed image with the shared glyph atlas."""
+    return get_atlas(font_path, glyphs).render_indexed(chars, hue)
+
+
+class GifStreamWriter:
+    """
+    Writes an animated GIF frame by frame, so memory use stays flat however long the recording runs.
+
+    Args:
+        filename (str): Output GIF path.
+        fps (int): Playback frame rate.
+
+    Indexed ("P") frames from render_indexed_image are written as-is against the global
+    color table taken from the first frame. RGB frames get an adaptive local palette each.
+    """
+
+    def __init__(self, filename, fps):
+        self.filename = filename
+        self.duration_ms = max(1, int(round(1000 / fps)))  # 1 ms minimum
+        self.frames = 0
+        self._fp = open(filename, "wb")
+
+    def write(self, image):
+        """Appends one frame to the file."""
+        local_palette = image.mode != "P"
+        if local_palette:
+            image = image.convert("P", palette=Image.ADAPTIVE, colors=256)
+        if self.frames == 0:
+            header, _ = GifImagePlugin.getheader(image, info={"loop": 0})
+            self._fp.write(b"".join(header))
+        for chunk in GifImagePlugin.getdata(image, duration=self.duration_ms, include_color_table=local_palette):
+            self._fp.write(chunk)
+        self.frames += 1
+
+    def close(self):
+        if self._fp.closed:
+            return
+        self._fp.write(b";")  # GIF trailer
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def ffmpeg_available(ffmpeg="ffmpeg"):
+    """True when the ffmpeg executable is on PATH."""
+    return shutil.which(ffmpeg) is not None
+
+
+class FfmpegStreamWriter:
+    """
+    Pipes raw RGB frames to an ffmpeg process that encodes an H.264 MP4.
+
+    Args:
+        filename (str): Output MP4 path.
+        fps (int): Frame rate.
+        ffmpeg (str): ffmpeg executable.
+        audio (str): Optional audio file muxed in as an AAC track, cut to the video length.
+
+    The encoder starts on the first frame, when the frame size is known. A missing ffmpeg
+    raises RuntimeError here, when the writer is opened, not in the middle of the frames.
+    """
+
+    def __init__(self, filename, fps, ffmpeg="ffmpeg", audio=None):
+        if not ffmpeg_available(ffmpeg):
+            raise RuntimeError(f"{ffmpeg} not found on PATH, MP4 output needs ffmpeg")
+        self.filename = filename
+        self.fps = fps
+        self.ffmpeg = ffmpeg
+        self.audio = audio
+        self.frames = 0
+        self._process = None
+
+    def _start(self, size):
+        command = [
+            self.ffmpeg, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{size[0]}x{size[1]}", "-r", str(self.fps),
+            "-i", "-",
+        ]
+        if self.audio:
+            command += ["-i", self.audio, "-map", "0:v", "-map", "1:a", "-c:a", "aac", "-shortest"]
+        command += ["-c:v", "libx264", "-pix_fmt", "yuv420p", self.filename]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, image):
+        if self._process is None:
+            self._start(image.size)
+        self._process.stdin.write(image.convert("RGB").tobytes())
+        self.frames += 1
+
+    def close(self):
+        if self._process is None:
+            return
+        self._process.stdin.close()
+        self._process.wait()
+        self._process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_stream_writer(kind, fps, filename=None, audio=None):
+    """
+    Opens a streaming writer.
+
+    Args:
+        kind (str): "gif" or "mp4".
+        fps (int): Frame rate.
+        filename (str): Output path, defaults to a timestamped mandala_*.gif/mp4.
+        audio (str): Audio file muxed into MP4 output.
+    """
+    if filename is None:
+        filename = f"mandala_{time.strftime('%Y%m%d_%H%M%S')}.{kind}"
+    if kind == "gif":
+        return GifStreamWriter(filename, fps)
+    if kind == "mp4":
+        return FfmpegStreamWriter(filename, fps, audio=audio)
+    raise ValueError(f"Unknown stream format: {kind}")
+
+
+class FrameRing:
+    """
+    Fixed-size ring of raw frames in a memory-mapped .npy file, for "keep the last N seconds" capture.
+
+    Args:
+        filename (str): Backing file, created or overwritten.
+        capacity (int): Number of frames kept, older frames are overwritten.
+        width (int): Canvas width in characters.
+        height (int): Canvas height in characters.
+
+    Each slot holds the frame's uint8 palette-index and hue-index grids plus the palette index and
+    frame number, so memory use never grows and the OS page cache handles persistence.
+    """
+
+    def __init__(self, filename, capacity, width, height):
+        self.filename = filename
+        self.capacity = capacity
+        dtype = np.dtype([
+            ("frame_count", "<i8"),
+            ("palette_index", "u1"),
+            ("index", "u1", (height, width)),
+            ("hue", "u1", (height, width)),
+        ])
+        self.slots = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=(capacity,))
+        self.head = 0  # Next slot to write
+        self.frames = 0  # Number of valid slots
+
+    def __len__(self):
+        return self.frames
+
+    def append(self, index, hue, palette_index, frame_count):
+        slot = self.slots[self.head]
+        slot["index"] = index
+        slot["hue"] = hue
+        slot["palette_index"] = palette_index
+        slot["frame_count"] = frame_count
+        self.head = (self.head + 1) % self.capacity
+        self.frames = min(self.frames + 1, self.capacity)
+
+    def __iter__(self):
+        """Yields the stored slots from oldest to newest."""
+        start = (self.head - self.frames) % self.capacity
+        for i in range(self.frames):
+            yield self.slots[(start + i) % self.capacity]
+
+    def iter_frames(self, palettes):
+        """Yields (chars, hue) grids from oldest to newest, mapping palette indices through palettes."""
+        palettes = [np.array(palette) for palette in palettes]
+        for slot in self:
+            yield palettes[slot["palette_index"]][slot["index"]], slot["hue"]
+
+    def close(self):
+        self.slots.flush()
+        del self.slots
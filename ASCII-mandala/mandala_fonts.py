@@ -0,0 +1,131 @@
+"""
+Persistent glyph-coverage index for fonts, shared by ascii_mandala.py and font_chooser.py.
+
+Each font's cmap is parsed once into a set of codepoints and stored in an
+on-disk cache keyed by path, modification time and size, so later runs
+answer coverage queries without opening the font files at all.
+"""
+
+import json
+import os
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ascii_mandala", "font_coverage.json")
+
+
+def read_cmap(font_path):
+    """Returns the set of codepoints mapped by any cmap subtable of the font."""
+    from fontTools.ttLib import TTFont  # Only needed on cache misses
+    with TTFont(font_path, lazy=True) as font:
+        codepoints = set()
+        for table in font["cmap"].tables:
+            codepoints.update(table.cmap)
+    return codepoints
+
+
+def _to_ranges(codepoints):
+    # Sorted [start, end] pairs keep the JSON cache small, fonts map long contiguous blocks
+    ranges = []
+    for cp in sorted(codepoints):
+        if ranges and cp == ranges[-1][1] + 1:
+            ranges[-1][1] = cp
+        else:
+            ranges.append([cp, cp])
+    return ranges
+
+
+def _from_ranges(ranges):
+    return frozenset(cp for start, end in ranges for cp in range(start, end + 1))
+
+
+def font_signature(font_path):
+    """Cache key parts that change whenever the font file does."""
+    stat = os.stat(font_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class FontCoverageIndex:
+    """
+    Codepoint sets of fonts, cached on disk.
+
+    Args:
+        cache_path (str): JSON cache file, None keeps the index in memory only.
+    """
+
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH):
+        self.cache_path = cache_path
+        self._entries = {}  # abs path -> {"mtime_ns", "size", "ranges"}
+        self._codepoints = {}  # abs path -> frozenset, parsed lazily from the entries
+        self._dirty = False
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def is_current(self, font_path):
+        """True if the cache holds an entry for the font as it is on disk now."""
+        key = os.path.abspath(font_path)
+        entry = self._entries.get(key)
+        return entry is not None and (entry["mtime_ns"], entry["size"]) == font_signature(font_path)
+
+    def update(self, font_path, codepoints):
+        """Stores codepoints read elsewhere (e.g. in a worker process) for the font's current signature."""
+        key = os.path.abspath(font_path)
+        mtime_ns, size = font_signature(font_path)
+        self._entries[key] = {"mtime_ns": mtime_ns, "size": size, "ranges": _to_ranges(codepoints)}
+        self._codepoints[key] = frozenset(codepoints)
+        self._dirty = True
+
+    def codepoints(self, font_path):
+        """Returns the font's codepoints, parsing the cmap only if the cache is missing or stale."""
+        key = os.path.abspath(font_path)
+        if not self.is_current(font_path):
+            self.update(font_path, read_cmap(font_path))
+        elif key not in self._codepoints:
+            self._codepoints[key] = _from_ranges(self._entries[key]["ranges"])
+        return self._codepoints[key]
+
+    def has_glyph(self, font_path, ch):
+        return ord(ch) in self.codepoints(font_path)
+
+    def missing(self, font_path, chars):
+        """Returns the characters of chars (spaces excluded) that the font has no glyph for, in order."""
+        codepoints = self.codepoints(font_path)
+        return [ch for ch in chars if ch != " " and ord(ch) not in codepoints]
+
+    def coverage(self, font_path, palettes):
+        """
+        Counts supported characters over whole palettes in one call.
+
+        Args:
+            font_path (str): Font to check.
+            palettes (list[list[str]]): Palettes to check, spaces always count as supported.
+
+        Returns:
+            tuple: (supported, total) character counts.
+        """
+        codepoints = self.codepoints(font_path)
+        chars = [ch for palette in palettes for ch in palette]
+        supported = sum(1 for ch in chars if ch == " " or ord(ch) in codepoints)
+        return supported, len(chars)
+
+    def save(self):
+        """Writes the cache if anything changed."""
+        if not self.cache_path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.cache_path)
+        self._dirty = False
+
+
+def list_fonts(font_dir="fonts"):
+    """Returns the .ttf/.otf files of a directory."""
+    return [
+        os.path.join(font_dir, f)
+        for f in sorted(os.listdir(font_dir))
+        if f.lower().endswith((".ttf", ".otf"))
+    ]
@@ -0,0 +1,85 @@
+"""
+Pipelined frame production for the ASCII mandala.
+
+Generation and terminal writes normally run back to back, so a slow
+terminal (e.g. over SSH) stalls generation and the other way round.
+FramePipeline moves generation and ANSI encoding to a worker thread that
+works on frame N+1 while the main thread writes frame N. NumPy and the
+terminal write both release the GIL, so the two overlap.
+
+The main thread keeps all mutable state (keyboard input, animation,
+captures) and hands each frame over as an immutable request snapshot,
+so keyboard changes reach the producer with the next request and the
+producer never reads state that the main thread is changing.
+"""
+
+import queue
+import threading
+
+_STOP = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+class FramePipeline:
+    """
+    Runs produce(request) in a worker thread, at most `depth` frames ahead of the consumer.
+
+    Args:
+        produce (callable): Turns a request into a result, only ever called from the worker thread.
+        depth (int): Frames produced ahead of the one being written (1–2). Each frame of depth adds
+            one frame of latency between a key press and the screen.
+
+    Usage:
+        pipeline.submit(request)
+        if pipeline.ready():
+            request, result = pipeline.take()
+    """
+
+    def __init__(self, produce, depth=1):
+        self.produce = produce
+        self.depth = depth
+        self.in_flight = 0  # Submitted requests whose results have not been taken yet
+        self._requests = queue.Queue(maxsize=depth + 1)
+        self._results = queue.Queue(maxsize=depth + 1)
+        self._thread = threading.Thread(target=self._run, name="mandala-producer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            if request is _STOP:
+                return
+            try:
+                result = self.produce(request)
+            except BaseException as e:  # Re-raised in the consumer by take()
+                result = _Failure(e)
+            self._results.put((request, result))
+
+    def submit(self, request):
+        """Queues a request, blocks while the producer is already depth + 1 requests behind."""
+        self._requests.put(request)
+        self.in_flight += 1
+
+    def ready(self):
+        """True when the consumer should take a result to keep at most depth frames in flight."""
+        return self.in_flight > self.depth
+
+    def take(self):
+        """Returns the oldest (request, result) pair, waiting for it if needed."""
+        request, result = self._results.get()
+        self.in_flight -= 1
+        if isinstance(result, _Failure):
+            raise result.error
+        return request, result
+
+    def close(self):
+        """Stops the worker after the queued requests, their results are discarded."""
+        while self.in_flight:
+            self._results.get()
+            self.in_flight -= 1
+        self._requests.put(_STOP)
+        self._thread.join(timeout=1)
@@ -0,0 +1,179 @@
+"""
+Headless multi-core rendering of mandala parameter trajectories.
+
+A trajectory is a start state plus a set of parameters that move at a
+constant rate, the same way a held key animates them in the interactive
+session. All frame parameters are computed up front, split into chunks
+and rendered by a process pool. Finished chunks are written in frame
+order, and at most a fixed number of frames (max_frames) are rendered
+but not yet written, so memory use stays flat however long the output is
+and however many cores render it.
+
+Used by `python ascii_mandala.py render ...` and `python ascii_mandala_music.py render ...`.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from mandala_engine import MandalaEngine
+from mandala_replay import LoggedParams
+
+# Per-frame step of each animatable parameter as a multiple of the rate, same as the interactive animation
+ANIMATION_STEPS = {
+    "freq_r": 1,
+    "freq_a": 2,
+    "phase_r": 3,
+    "phase_a": 3,
+    "offset_x": 10,
+    "offset_y": 10,
+}
+
+
+def trajectory(start, animate, rate, frames, palette_index=0):
+    """
+    Computes the parameters of every frame of a trajectory.
+
+    Args:
+        start: Object with freq_r, freq_a, phase_r, phase_a, offset_x and offset_y (e.g. MandalaParams).
+        animate (dict[str, int]): Animated parameter names mapped to their direction (+1/-1).
+        rate (float): Change amount per frame, like change_amount in the interactive session.
+        frames (int): Number of frames.
+        palette_index (int): Palette used for every frame.
+
+    Yields:
+        LoggedParams: Parameters of frames 0..frames-1, frame 0 is the start state.
+    """
+    state = {name: getattr(start, name) for name in ANIMATION_STEPS}
+    for frame_count in range(frames):
+        yield LoggedParams(
+            frame_count, state["freq_r"], state["freq_a"], state["phase_r"], state["phase_a"],
+            state["offset_x"], state["offset_y"], palette_index,
+        )
+        for name, direction in animate.items():
+            delta = rate * direction * ANIMATION_STEPS[name]
+            state[name] += int(delta) if name.startswith("offset") else delta
+
+
+class FrameParams(LoggedParams):
+    """LoggedParams with a color brightness, for audio-driven renders (1.0 = full colors)."""
+
+    __slots__ = ("brightness",)
+
+    def __init__(self, frame_count, freq_r, freq_a, phase_r, phase_a, offset_x, offset_y, palette_index,
+                 brightness=1.0):
+        super().__init__(frame_count, freq_r, freq_a, phase_r, phase_a, offset_x, offset_y, palette_index)
+        self.brightness = brightness
+
+
+_engines = {}  # Per worker process, keyed by canvas size
+
+
+def render_chunk(task):
+    """
+    Worker: renders a chunk of frames.
+
+    Args:
+        task (tuple): (kind, width, height, palettes, font_path, output, records).
+
+    Returns:
+        list: PIL images in frame order, or the written file names for a PNG sequence.
+    """
+    from mandala_capture import render_image, render_indexed_image
+
+    kind, width, height, palettes, font_path, output, records = task
+    engine = _engines.get((width, height))
+    if engine is None:
+        engine = _engines[(width, height)] = MandalaEngine(width, height)
+    glyphs = [ch for palette in palettes for ch in palette]
+    results = []
+    for params in records:
+        palette = np.array(palettes[params.palette_index])
+        chars = palette[engine.indices(params, len(palette))]
+        hue = engine.hues(params, params.frame_count)
+        brightness = getattr(params, "brightness", 1.0)
+        if kind == "gif":  # One global palette, brightness is not applied
+            results.append(render_indexed_image(chars, hue, font_path, glyphs))
+        elif kind == "mp4":
+            results.append(render_image(chars, engine.colors(hue, brightness), font_path, glyphs))
+        else:
+            filename = os.path.join(output, f"frame_{params.frame_count:06d}.png")
+            render_image(chars, engine.colors(hue, brightness), font_path, glyphs).save(filename)
+            results.append(filename)
+    return results
+
+
+def _chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def render_records(records, width, height, fps, palettes, output, font_path, jobs=None, chunk_size=16, progress=None,
+                   audio=None, max_frames=64):
+    """
+    Renders frames with a process pool and writes them in order.
+
+    Args:
+        records (iterable[LoggedParams]): Frame parameters in output order.
+        width (int): Canvas width in characters.
+        height (int): Canvas height in characters.
+        fps (int): Frame rate of GIF/MP4 output.
+        palettes (list[list[str]]): Palettes the records refer to by index.
+        output (str): .gif or .mp4 file, anything else is a directory for a PNG sequence.
+        font_path (str): Font used for rendering.
+        jobs (int): Worker processes, defaults to the CPU count.
+        chunk_size (int): Frames per worker task, lowered so that the chunks in flight fit max_frames.
+        progress (callable): Called with the number of frames written so far after each chunk.
+        audio (str): Audio file muxed into MP4 output.
+        max_frames (int): Frames rendered but not yet written at most (about 2.6 MB each at 120x40),
+            at least one per worker.
+
+    Returns:
+        int: Number of frames written.
+    """
+    from mandala_capture import open_stream_writer
+
+    kind = os.path.splitext(output)[1].lower().lstrip(".")
+    if kind not in ("gif", "mp4"):
+        kind = "png"
+        os.makedirs(output, exist_ok=True)
+    jobs = jobs or os.cpu_count() or 1
+    in_flight = jobs + 1  # Chunks, one per worker plus the one being written
+    chunk_size = max(1, min(chunk_size, max_frames // in_flight))
+    tasks = ((kind, width, height, palettes, font_path, output, chunk) for chunk in _chunks(records, chunk_size))
+
+    writer = open_stream_writer(kind, fps, output, audio=audio) if kind != "png" else None
+    count = 0
+    try:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            pending = deque()
+            for task in tasks:
+                pending.append(pool.submit(render_chunk, task))
+                if len(pending) < in_flight:  # Keep every worker busy but bound the finished-but-unwritten frames
+                    continue
+                count += _write_chunk(writer, pending.popleft().result())
+                if progress:
+                    progress(count)
+            while pending:
+                count += _write_chunk(writer, pending.popleft().result())
+                if progress:
+                    progress(count)
+    finally:
+        if writer:
+            writer.close()
+    return count
+
+
+def _write_chunk(writer, results):
+    if writer:
+        for image in results:
+            writer.write(image)
+    return len(results)
@@ -0,0 +1,171 @@
+"""
+Parameter-log recording and offline replay for the ASCII mandala.
+
+A frame is fully determined by the mandala parameters, the palette in use
+and the frame number, so instead of storing rendered images a recording
+can store one small fixed-size record per frame. The log is written as the
+session runs and replayed later at any resolution, font or output format.
+
+Usage:
+    python mandala_replay.py session.mlog out.gif
+    python mandala_replay.py session.mlog out.mp4 --width 240 --height 80 --font fonts/FiraCode-Regular.ttf
+    python mandala_replay.py session.mlog frames/
+
+Output format follows the extension: .gif, .mp4 (needs ffmpeg) or a directory for a PNG sequence.
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+from mandala_engine import HUE_RGB, MandalaEngine
+
+MAGIC = b"MNDLOG1\n"
+# frame_count, freq_r, freq_a, phase_r, phase_a, offset_x, offset_y, palette index
+RECORD = struct.Struct("<I4dhhB")
+
+
+class LoggedParams:
+    """Mandala parameters of one logged frame, duck-typed like MandalaParams for MandalaEngine."""
+
+    __slots__ = ("frame_count", "freq_r", "freq_a", "phase_r", "phase_a", "offset_x", "offset_y", "palette_index")
+
+    def __init__(self, frame_count, freq_r, freq_a, phase_r, phase_a, offset_x, offset_y, palette_index):
+        self.frame_count = frame_count
+        self.freq_r = freq_r
+        self.freq_a = freq_a
+        self.phase_r = phase_r
+        self.phase_a = phase_a
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+        self.palette_index = palette_index
+
+
+class ParamLogWriter:
+    """
+    Appends one RECORD per frame to a log file.
+
+    Args:
+        filename (str): Output .mlog path.
+        width (int): Canvas width of the session.
+        height (int): Canvas height of the session.
+        fps (int): Frame rate of the session.
+        palettes (list): All palettes as lists or arrays of characters, records refer to them by index.
+    """
+
+    def __init__(self, filename, width, height, fps, palettes):
+        self.filename = filename
+        self.frames = 0
+        palettes = [[str(ch) for ch in palette] for palette in palettes]  # Lists or palette arrays
+        header = json.dumps({"width": width, "height": height, "fps": fps, "palettes": palettes}).encode("utf-8")
+        self._fp = open(filename, "wb")
+        self._fp.write(MAGIC + struct.pack("<I", len(header)) + header)
+
+    def write(self, params, palette_index, frame_count):
+        self._fp.write(RECORD.pack(
+            frame_count, params.freq_r, params.freq_a, params.phase_r, params.phase_a,
+            params.offset_x, params.offset_y, palette_index,
+        ))
+        self.frames += 1
+
+    def close(self):
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_param_log(filename):
+    """
+    Reads a parameter log.
+
+    Returns:
+        tuple:
+            header (dict): width, height, fps and palettes of the recorded session.
+            records (iterator[LoggedParams]): Frames in recording order, read lazily.
+    """
+    with open(filename, "rb") as fp:
+        if fp.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filename} is not a mandala parameter log")
+        (header_len,) = struct.unpack("<I", fp.read(4))
+        header = json.loads(fp.read(header_len).decode("utf-8"))
+        records_start = fp.tell()
+
+    def records():
+        with open(filename, "rb") as fp:
+            fp.seek(records_start)
+            while True:
+                data = fp.read(RECORD.size)
+                if len(data) < RECORD.size:
+                    return
+                yield LoggedParams(*RECORD.unpack(data))
+
+    return header, records()
+
+
+def replay_frames(filename, width=None, height=None):
+    """
+    Re-renders a parameter log.
+
+    Args:
+        filename (str): Parameter log path.
+        width (int): Canvas width, defaults to the recorded width.
+        height (int): Canvas height, defaults to the recorded height.
+
+    Yields:
+        tuple: (chars, hue) grids of each frame, identical to the live session at the recorded size.
+    """
+    header, records = read_param_log(filename)
+    engine = MandalaEngine(width or header["width"], height or header["height"])
+    palettes = [np.array(palette) for palette in header["palettes"]]
+    for params in records:
+        palette = palettes[params.palette_index]
+        index = engine.indices(params, len(palette))
+        yield palette[index], engine.hues(params, params.frame_count)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a mandala parameter log offline")
+    parser.add_argument("log", help="Parameter log (.mlog) recorded with --stream log")
+    parser.add_argument("output", help="Output .gif, .mp4 or a directory for a PNG sequence")
+    parser.add_argument("--width", type=int, help="Width in characters (default: as recorded)")
+    parser.add_argument("--height", type=int, help="Height in characters (default: as recorded)")
+    parser.add_argument("--fps", type=int, help="Frame rate (default: as recorded)")
+    parser.add_argument("--font", default="fonts/Symbola.ttf", help="Font used for rendering")
+    args = parser.parse_args(argv)
+    # PIL is only needed for rendering
+    from mandala_capture import open_stream_writer, render_image, render_indexed_image
+
+    header, _ = read_param_log(args.log)
+    fps = args.fps or header["fps"]
+    glyphs = [ch for palette in header["palettes"] for ch in palette]
+    kind = os.path.splitext(args.output)[1].lower().lstrip(".")
+    frames = replay_frames(args.log, args.width, args.height)
+
+    count = 0
+    if kind in ("gif", "mp4"):
+        with open_stream_writer(kind, fps, args.output) as writer:
+            for chars, hue in frames:
+                if kind == "gif":
+                    writer.write(render_indexed_image(chars, hue, args.font, glyphs))
+                else:
+                    writer.write(render_image(chars, HUE_RGB[hue], args.font, glyphs))
+                count += 1
+    else:
+        os.makedirs(args.output, exist_ok=True)
+        for chars, hue in frames:
+            filename = os.path.join(args.output, f"frame_{count:04d}.png")
+            render_image(chars, HUE_RGB[hue], args.font, glyphs).save(filename)
+            count += 1
+    print(f"✅ Rendered {count} frames → {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+"""
+Per-stage frame timing for the ASCII mandala main loop.
+
+FrameTimer splits every frame into laps (input, animate, generate, encode,
+write, capture, sleep): each mark() charges the time since the previous mark
+to a stage. Per-frame stage totals go into a fixed-size rolling window, so
+p50/p99 can be shown live without the history growing, and optionally to a
+trace file for offline analysis:
+
+    *.json   Chrome trace event format (open in chrome://tracing or Perfetto)
+    other    CSV, one row per frame with milliseconds per stage
+
+FrameScheduler paces the loop against absolute deadlines on the monotonic
+clock, so the animation stays in sync with wall-clock time instead of
+drifting by the work time of every frame. LodController watches the work
+time of each frame and lowers or raises the engine's level of detail.
+"""
+
+import csv
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+STAGES = ("input", "animate", "generate", "encode", "write", "capture", "sleep")
+
+
+class CsvTrace:
+    """Writes one row per frame: frame number, start time and milliseconds spent in each stage."""
+
+    def __init__(self, filename, stages=STAGES):
+        self.stages = stages
+        self._fp = open(filename, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._fp)
+        self._writer.writerow(["frame", "start_ms", *(f"{stage}_ms" for stage in stages), "total_ms"])
+
+    def write(self, frame, start, totals, laps):
+        self._writer.writerow([frame, f"{start * 1000:.3f}", *(f"{t * 1000:.3f}" for t in totals),
+                               f"{totals.sum() * 1000:.3f}"])
+
+    def close(self):
+        self._fp.close()
+
+
+class ChromeTrace:
+    """Writes every lap as a complete ("X") event of the Chrome trace event format, streamed as a JSON array."""
+
+    def __init__(self, filename, stages=STAGES):
+        self.stages = stages
+        self._fp = open(filename, "w", encoding="utf-8")
+        self._fp.write("[\n")
+        self._first = True
+
+    def _event(self, event):
+        self._fp.write(("" if self._first else ",\n") + json.dumps(event))
+        self._first = False
+
+    def write(self, frame, start, totals, laps):
+        self._event({"name": "frame", "ph": "X", "pid": 1, "tid": 1, "ts": round(start * 1e6, 1),
+                     "dur": round(totals.sum() * 1e6, 1), "args": {"frame": frame}})
+        for stage, lap_start, duration in laps:
+            self._event({"name": stage, "ph": "X", "pid": 1, "tid": 2, "ts": round(lap_start * 1e6, 1),
+                         "dur": round(duration * 1e6, 1)})
+
+    def close(self):
+        self._fp.write("\n]\n")
+        self._fp.close()
+
+
+def open_trace(filename, stages=STAGES):
+    """Opens a Chrome trace for .json files and a CSV trace otherwise."""
+    if filename.lower().endswith(".json"):
+        return ChromeTrace(filename, stages)
+    return CsvTrace(filename, stages)
+
+
+class FrameTimer:
+    """
+    Lap timer for the frame loop with rolling per-stage windows.
+
+    Args:
+        stages (tuple[str]): Stage names.
+        window (int): Number of recent frames kept for the percentiles.
+        trace: Optional CsvTrace/ChromeTrace that receives every frame.
+
+    Usage:
+        timer.start_frame()
+        ... timer.mark("input") ... timer.mark("generate") ...
+        timer.end_frame()
+    """
+
+    def __init__(self, stages=STAGES, window=512, trace=None):
+        self.stages = stages
+        self._stage_index = {stage: i for i, stage in enumerate(stages)}
+        self.samples = np.zeros((window, len(stages)))  # Seconds per stage, ring buffer of frames
+        self.head = 0
+        self.count = 0
+        self.frames = 0
+        self.trace = trace
+        self._origin = time.perf_counter()
+        self._totals = np.zeros(len(stages))
+        self._laps = []
+        self._frame_start = self._last = self._origin
+
+    def start_frame(self):
+        self._frame_start = self._last = time.perf_counter()
+        self._totals[:] = 0
+        self._laps.clear()
+
+    def mark(self, stage):
+        """Charges the time since the previous mark (or the frame start) to stage."""
+        now = time.perf_counter()
+        self._totals[self._stage_index[stage]] += now - self._last
+        if self.trace is not None:
+            self._laps.append((stage, self._last - self._origin, now - self._last))
+        self._last = now
+
+    def end_frame(self):
+        self.samples[self.head] = self._totals
+        self.head = (self.head + 1) % len(self.samples)
+        self.count = min(self.count + 1, len(self.samples))
+        if self.trace is not None:
+            self.trace.write(self.frames, self._frame_start - self._origin, self._totals, self._laps)
+        self.frames += 1
+
+    def percentiles(self, q=(50, 99)):
+        """
+        Returns:
+            np.ndarray: len(q) x len(stages) array of stage times in seconds over the rolling window.
+        """
+        if self.count == 0:
+            return np.zeros((len(q), len(self.stages)))
+        return np.percentile(self.samples[:self.count], q, axis=0)
+
+    def summary(self):
+        """One-line p50/p99 overlay text in milliseconds, e.g. "generate 1.2/3.4"."""
+        p50, p99 = self.percentiles((50, 99))
+        parts = [f"{stage} {a * 1000:.1f}/{b * 1000:.1f}" for stage, a, b in zip(self.stages, p50, p99)]
+        return "⏱ p50/p99 ms: " + "  ".join(parts)
+
+    def close(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
+
+
+class FrameScheduler:
+    """
+    Absolute-deadline frame pacing on the monotonic clock.
+
+    Frame n owns the slot [start + n * period, start + (n + 1) * period). After its work the loop
+    sleeps until the end of the slot, so time spent in one frame is not added to the next one.
+
+    Args:
+        fps (float): Target frame rate.
+        policy (str): What to do when frames overrun their slot:
+            "drop" keeps wall-clock sync: frames that start more than a slot late skip their
+            terminal output (the animation still advances), at most max_drop in a row.
+            "slow" never skips output: the schedule restarts from the late frame, so the
+            animation slows down instead of catching up.
+        max_drop (int): Longest run of dropped frames before one is drawn anyway.
+        max_lag (float): With "drop", a backlog longer than this many seconds is forgiven
+            instead of caught up (e.g. after the loop was suspended).
+
+    Usage:
+        render = scheduler.begin_frame()
+        ... advance the animation, draw only if render ...
+        scheduler.end_frame()
+    """
+
+    def __init__(self, fps, policy="drop", max_drop=4, max_lag=1.0):
+        if policy not in ("drop", "slow"):
+            raise ValueError(f"Unknown frame policy: {policy}")
+        self.fps = fps
+        self.period = 1.0 / fps
+        self.policy = policy
+        self.max_drop = max_drop
+        self.max_lag = max_lag
+        self.start = None
+        self.frame = 0  # Slot index of the current frame
+        self.dropped = 0  # Frames whose output was skipped
+        self.late = 0  # Frames that ended after their deadline
+        self.last_sleep = 0.0
+        self.work_time = 0.0  # Time between begin_frame and end_frame of the last frame
+        self._began = None
+        self._drop_run = 0
+        self._ticks = deque(maxlen=max(2, int(round(fps)) + 1))  # Drawn frame times of the last second
+        self._rendering = True
+
+    def begin_frame(self):
+        """Starts the next frame. Returns False if its terminal output should be skipped."""
+        now = self._began = time.monotonic()
+        if self.start is None:
+            self.start = now
+        lag = now - (self.start + self.frame * self.period)
+        if self.policy == "drop" and lag > self.max_lag:
+            self.start = now - self.frame * self.period  # Too far behind to catch up, resync
+            lag = 0.0
+        self._rendering = not (self.policy == "drop" and lag > self.period and self._drop_run < self.max_drop)
+        if self._rendering:
+            self._drop_run = 0
+            self._ticks.append(now)
+        else:
+            self._drop_run += 1
+            self.dropped += 1
+        return self._rendering
+
+    def end_frame(self):
+        """Sleeps until the frame's deadline. Returns the time slept in seconds (0 when late)."""
+        deadline = self.start + (self.frame + 1) * self.period
+        self.frame += 1
+        now = time.monotonic()
+        self.work_time = now - self._began
+        remaining = deadline - now
+        if remaining > 0:
+            time.sleep(remaining)
+            self.last_sleep = remaining
+            return remaining
+        self.late += 1
+        self.last_sleep = 0.0
+        if self.policy == "slow":
+            self.start = time.monotonic() - self.frame * self.period  # Next frame gets a full slot
+        return 0.0
+
+    @property
+    def achieved_fps(self):
+        """Drawn frames per second over about the last second."""
+        if len(self._ticks) < 2:
+            return 0.0
+        return (len(self._ticks) - 1) / (self._ticks[-1] - self._ticks[0])
+
+    def status(self):
+        return (f"{self.achieved_fps:5.1f}/{self.fps:g} fps ({self.policy}) "
+                f"dropped {self.dropped} late {self.late}")
+
+
+class LodController:
+    """
+    Adaptive level of detail driven by the measured work time per frame.
+
+    Args:
+        budget (float): Frame budget in seconds (1 / fps).
+        levels (tuple): (step, color_interval) per level for MandalaEngine.set_lod, cheapest last.
+        high (float): Work time above this share of the budget counts as overloaded.
+        low (float): Work time below this share of the budget counts as headroom.
+        patience (int): Consecutive overloaded frames before dropping a level. Raising a
+            level needs four times as many frames with headroom, so the detail does not flicker.
+
+    Only drawn frames should be fed to update(), dropped frames do almost no work.
+    """
+
+    LEVELS = ((1, 1), (1, 2), (2, 2), (3, 3))
+
+    def __init__(self, budget, levels=LEVELS, high=0.9, low=0.5, patience=10):
+        self.budget = budget
+        self.levels = levels
+        self.high = high
+        self.low = low
+        self.patience = patience
+        self.level = 0
+        self.average = 0.0
+        self._over = 0
+        self._under = 0
+
+    @property
+    def lod(self):
+        """(step, color_interval) of the current level."""
+        return self.levels[self.level]
+
+    def update(self, work_time):
+        """Feeds one frame's work time. Returns True if the level changed."""
+        self.average = work_time if self.average == 0.0 else self.average * 0.8 + work_time * 0.2
+        self._over = self._over + 1 if self.average > self.high * self.budget else 0
+        self._under = self._under + 1 if self.average < self.low * self.budget else 0
+        if self._over >= self.patience and self.level < len(self.levels) - 1:
+            self._change(+1)
+            return True
+        if self._under >= self.patience * 4 and self.level > 0:
+            self._change(-1)
+            return True
+        return False
+
+    def _change(self, direction):
+        self.level += direction
+        self.average = 0.0  # Judge the new level on its own frames
+        self._over = self._under = 0
+
+    def status(self):
+        step, color_interval = self.lod
+        return f"LOD {self.level} (cell step {step}, colors every {color_interval})"